@@ -0,0 +1,117 @@
+"""Materialized aggregates kept current on every insert.
+
+For each dimension (a dictionary-encoded column such as country or
+utm_source) the counters below are stored per dictionary code, so a new row
+touches a constant number of cells and summaries are read straight from the
+counters without scanning the log:
+
+- row count, converted count and bounced count
+- sum and sum of squares of every numeric column
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from weblog_store import grow
+
+# Dimensions that get their own counters
+DIMENSIONS = (
+    'country', 'city', 'device_type', 'operating_system', 'page_visited',
+    'utm_source', 'utm_medium', 'utm_campaign',
+)
+
+
+class _Counters:
+    """Counters for one dimension, indexed by dictionary code"""
+
+    def __init__(self, n_metrics: int):
+        self.count = np.zeros(0, dtype=np.int64)
+        self.converted = np.zeros(0, dtype=np.int64)
+        self.bounced = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, n_metrics), dtype=np.float64)
+        self.squares = np.zeros((0, n_metrics), dtype=np.float64)
+
+    def reserve(self, size: int):
+        self.count = grow(self.count, size)
+        self.converted = grow(self.converted, size)
+        self.bounced = grow(self.bounced, size)
+        self.sums = grow(self.sums, size)
+        self.squares = grow(self.squares, size)
+
+
+class MaterializedAggregates:
+    """Per-dimension counters updated incrementally from a WeblogStore"""
+
+    def __init__(self, store, dimensions: Sequence[str] = DIMENSIONS):
+        self.store = store
+        self.metrics: List[str] = [name for name in store.fields if store.kinds[name] in ('int', 'float')]
+        self.dimensions = list(dimensions)
+        self.counters: Dict[str, _Counters] = {name: _Counters(len(self.metrics)) for name in self.dimensions}
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def update(self, rows: range):
+        """Add a batch of newly appended rows to every dimension's counters"""
+        if not len(rows):
+            return
+        store = self.store
+        rows = slice(rows.start, rows.stop)
+        values = np.column_stack([store.column(name)[rows].astype(np.float64) for name in self.metrics])
+        squares = values * values
+        converted = store.column('is_converted')[rows].astype(np.int64)
+        bounced = store.column('is_bounce')[rows].astype(np.int64)
+
+        for name, counters in self.counters.items():
+            codes = store.column(name)[rows]
+            counters.reserve(len(store.dictionary(name)))
+            np.add.at(counters.count, codes, 1)
+            np.add.at(counters.converted, codes, converted)
+            np.add.at(counters.bounced, codes, bounced)
+            np.add.at(counters.sums, codes, values)
+            np.add.at(counters.squares, codes, squares)
+
+    def _summary(self, count: int, converted: int, bounced: int, sums: np.ndarray, squares: np.ndarray) -> Dict[str, Any]:
+        count, converted, bounced = int(count), int(converted), int(bounced)
+        if not count:
+            return {'count': 0}
+        means = sums / count
+        variances = np.maximum(squares / count - means * means, 0.0)
+        return {
+            'count': count,
+            'conversion_rate': converted / count,
+            'bounce_rate': bounced / count,
+            'sum': {
+                name: int(round(total)) if self.store.kinds[name] == 'int' else total
+                for name, total in zip(self.metrics, sums.tolist())
+            },
+            'mean': dict(zip(self.metrics, means.tolist())),
+            'std': dict(zip(self.metrics, np.sqrt(variances).tolist())),
+        }
+
+    def summary(self, dimension: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Summaries per value of `dimension`, ordered by descending count, or a
+        single overall summary when no dimension is given.
+        """
+        if dimension is None:
+            # Every row lands in exactly one code of any dimension, so the
+            # totals of the first dimension are the overall totals
+            counters = self.counters[self.dimensions[0]]
+            return [self._summary(
+                counters.count.sum(), counters.converted.sum(), counters.bounced.sum(),
+                counters.sums.sum(axis=0), counters.squares.sum(axis=0),
+            )]
+
+        counters = self.counters[dimension]
+        values = self.store.dictionary(dimension)
+        n = len(values)
+        summaries = []
+        for code in np.argsort(-counters.count[:n], kind='stable').tolist():
+            summary = {dimension: values[code]}
+            summary.update(self._summary(
+                counters.count[code], counters.converted[code], counters.bounced[code],
+                counters.sums[code], counters.squares[code],
+            ))
+            summaries.append(summary)
+        return summaries
@@ -0,0 +1,206 @@
+"""Vectorized aggregations over a WeblogStore.
+
+All functions work directly on the store's columns (integer codes for
+strings, NumPy arrays for numbers) and only decode the handful of values
+that end up in the result.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from weblog_store import from_epoch_us
+
+# Bucket widths for time series, in microseconds
+INTERVALS = {
+    'minute': 60 * 1_000_000,
+    'hour': 3600 * 1_000_000,
+    'day': 86400 * 1_000_000,
+}
+
+# Combined group keys must fit an int64; below _MAX_BINCOUNT they are
+# deduplicated with bincount instead of a sort
+_MAX_KEY = 2 ** 62
+_MAX_BINCOUNT = 1 << 22
+
+
+def numeric_fields(store) -> List[str]:
+    """Names of the integer and float columns"""
+    return [name for name in store.fields if store.kinds[name] in ('int', 'float')]
+
+
+def string_fields(store) -> List[str]:
+    """Names of the dictionary-encoded columns"""
+    return [name for name in store.fields if store.kinds[name] == 'string']
+
+
+def _as_number(store, name: str, value):
+    """Report sums of integer columns as ints rather than bincount's floats"""
+    return int(round(value)) if store.kinds[name] == 'int' else float(value)
+
+
+def _group_ids(store, keys: Sequence[str], rows: np.ndarray):
+    """Assign a dense group id to every row; returns (group ids, per-group key codes)"""
+    # Mixed-radix key over the dictionary sizes, so groups sort by their codes
+    # in key order
+    sizes = [max(len(store.dictionary(name)), 1) for name in keys]
+    if int(np.prod(sizes, dtype=object)) >= _MAX_KEY:
+        # Too many combinations for one int64: fall back to a row-wise unique
+        codes = np.stack([store.column(name)[rows].astype(np.int64) for name in keys], axis=1)
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), codes
+        key_codes, group = np.unique(codes, axis=0, return_inverse=True)
+        return group.reshape(-1), key_codes
+
+    key = np.zeros(len(rows), dtype=np.int64)
+    for name, size in zip(keys, sizes):
+        key = key * size + store.column(name)[rows]
+    radix = int(np.prod(sizes))
+    if radix <= _MAX_BINCOUNT:
+        unique_keys = np.flatnonzero(np.bincount(key, minlength=radix))
+        lookup = np.zeros(radix, dtype=np.int64)
+        lookup[unique_keys] = np.arange(len(unique_keys))
+        group = lookup[key]
+    else:
+        unique_keys, group = np.unique(key, return_inverse=True)
+        group = group.reshape(-1)
+
+    key_codes = np.empty((len(unique_keys), len(keys)), dtype=np.int64)
+    rest = unique_keys
+    for i in range(len(keys) - 1, -1, -1):
+        rest, key_codes[:, i] = np.divmod(rest, sizes[i])
+    return group, key_codes
+
+
+def _distinct_per_group(group: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """Number of distinct codes within each group"""
+    if not len(group):
+        return np.zeros(n_groups, dtype=np.int64)
+    width = int(codes.max()) + 1
+    pairs = np.unique(group * width + codes)
+    return np.bincount(pairs // width, minlength=n_groups)
+
+
+def top_values(group: np.ndarray, codes: np.ndarray, n_groups: int, k: int):
+    """Top-k most frequent codes per group as a list of [(code, count), ...]"""
+    result: List[List[tuple]] = [[] for _ in range(n_groups)]
+    if not len(group):
+        return result
+    width = int(codes.max()) + 1
+    pairs, counts = np.unique(group * width + codes, return_counts=True)
+    pair_group = pairs // width
+    pair_code = pairs % width
+    # Most frequent first within each group; ties go to the earliest-seen value
+    order = np.lexsort((pair_code, -counts, pair_group))
+    pair_group, pair_code, counts = pair_group[order], pair_code[order], counts[order]
+    starts = np.searchsorted(pair_group, np.arange(n_groups))
+    rank = np.arange(len(pair_group)) - starts[pair_group]
+    keep = rank < k
+    for g, code, count in zip(pair_group[keep].tolist(), pair_code[keep].tolist(), counts[keep].tolist()):
+        result[g].append((code, count))
+    return result
+
+
+def group_by(store, rows: np.ndarray, keys: Sequence[str], top_fields: Sequence[str] = (), k: int = 3) -> List[Dict[str, Any]]:
+    """
+    Summarize `rows` grouped by one or more string columns.
+
+    Every group reports its row count, distinct visitors, sum and mean of each
+    numeric column, conversion and bounce rates, and the `k` most common values
+    of each field in `top_fields`. Groups are ordered by descending count.
+    """
+    group, key_codes = _group_ids(store, keys, rows)
+    n_groups = len(key_codes) if len(rows) else 0
+    counts = np.bincount(group, minlength=n_groups)
+
+    sums = {
+        name: np.bincount(group, weights=store.column(name)[rows], minlength=n_groups)
+        for name in numeric_fields(store)
+    }
+    converted = np.bincount(group, weights=store.column('is_converted')[rows], minlength=n_groups)
+    bounced = np.bincount(group, weights=store.column('is_bounce')[rows], minlength=n_groups)
+    visitors = _distinct_per_group(group, store.column('visitor_id')[rows].astype(np.int64), n_groups)
+    tops = {
+        name: top_values(group, store.column(name)[rows].astype(np.int64), n_groups, k)
+        for name in top_fields
+    }
+
+    key_values = [store.dictionary(key) for key in keys]
+    groups = []
+    for g in np.argsort(-counts, kind='stable').tolist():
+        count = int(counts[g])
+        entry: Dict[str, Any] = {key: values[key_codes[g][i]] for i, (key, values) in enumerate(zip(keys, key_values))}
+        entry['count'] = count
+        entry['distinct_visitors'] = int(visitors[g])
+        entry['sum'] = {name: _as_number(store, name, total[g]) for name, total in sums.items()}
+        entry['mean'] = {name: float(total[g]) / count for name, total in sums.items()}
+        entry['conversion_rate'] = float(converted[g]) / count
+        entry['bounce_rate'] = float(bounced[g]) / count
+        if tops:
+            entry['top'] = {
+                name: [{'value': store.dictionary(name)[code], 'count': n} for code, n in top[g]]
+                for name, top in tops.items()
+            }
+        groups.append(entry)
+    return groups
+
+
+def page_time_stats(store, rows: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Mean, median, mode(s) and population standard deviation of time on page,
+    per page title (falling back to the path when the title is empty).
+
+    Pages are listed in order of first appearance in `rows`.
+    """
+    titles = store.values('page_title', rows)
+    paths = store.values('page_visited', rows)
+    times = store.column('time_on_page_seconds')[rows]
+    pages = [title or path for title, path in zip(titles, paths)]
+
+    positions: Dict[str, List[int]] = {}
+    for position, page in enumerate(pages):
+        positions.setdefault(page, []).append(position)
+
+    stats = []
+    for page, indices in positions.items():
+        values = np.sort(times[indices])
+        distinct, counts = np.unique(values, return_counts=True)
+        stats.append({
+            'page': page,
+            'visits': len(values),
+            'mean': float(values.mean()),
+            'median': float(np.median(values)),
+            'mode': distinct[counts == counts.max()].tolist(),
+            'std': float(values.std()),
+        })
+    return stats
+
+
+def timeseries(store, rows: np.ndarray, interval: str, metrics: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Bucket `rows` by UTC timestamp into fixed `interval` bins and report each
+    non-empty bucket's start, row count, conversion rate and the mean of
+    every metric. Buckets are in chronological order.
+    """
+    width = INTERVALS[interval]
+    timestamps = store.column(store.time_field)[rows]
+    if not len(timestamps):
+        return []
+    buckets, group = np.unique(timestamps // width, return_inverse=True)
+    group = group.reshape(-1)
+    counts = np.bincount(group, minlength=len(buckets))
+    converted = np.bincount(group, weights=store.column('is_converted')[rows], minlength=len(buckets))
+    means = {
+        name: np.bincount(group, weights=store.column(name)[rows], minlength=len(buckets)) / counts
+        for name in metrics
+    }
+
+    series = []
+    for i, bucket in enumerate(buckets.tolist()):
+        series.append({
+            'bucket_start': from_epoch_us(bucket * width),
+            'count': int(counts[i]),
+            'conversion_rate': float(converted[i]) / int(counts[i]),
+            'mean': {name: float(values[i]) for name, values in means.items()},
+        })
+    return series
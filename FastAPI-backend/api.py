@@ -1,16 +1,63 @@
 # main.py
 print(">>> RUNNING FROM:", __file__)
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from typing import List, Dict, Any, Optional
 from starlette.middleware.cors import CORSMiddleware
 
+import base64
 import datetime
+import gzip
 import json
+import os
+import zlib
+
+import numpy as np
+
+import analytics
+from geo import GeoAggregates
+from ingest_log import IngestLog
+from paths import SessionPaths
+from row_cache import EncodedRowCache
+from search_index import SEARCH_FIELDS, SearchIndex
+from response_cache import ResponseCache, ResponseCacheMiddleware
+from sessions import SORT_KEYS as SESSION_SORT_KEYS, SessionTable
+from sketches import DIMENSIONS as SKETCH_DIMENSIONS, SketchAggregates
+from aggregates import DIMENSIONS as AGGREGATE_DIMENSIONS, MaterializedAggregates
+from visitors import SORT_KEYS as VISITOR_SORT_KEYS, VisitorRollups
+from weblog_store import WeblogStore, columnar_records, file_fingerprint, read_manifest, snapshot_matches, to_epoch_us
 
 app = FastAPI()
 
+# Set WEBLOG_SHARED=1 when running several workers (uvicorn --workers N): they
+# then share the ingest log as their common store and tail it for each other's rows
+WEBLOG_SHARED = os.environ.get("WEBLOG_SHARED") == "1"
+
+
+def _data_version() -> int:
+    """
+    Version the response cache and ETags are keyed on. Shared workers use the
+    row count, which (the store being append-only and every worker holding the
+    log's rows in log order) means the same data in every worker.
+    """
+    return len(weblogs_db) if WEBLOG_SHARED else weblogs_db.version
+
+
+# Serve repeated reads of unchanged data from an LRU response cache with ETag
+# revalidation. Added before CORS so that CORS headers wrap cached responses too.
+response_cache = ResponseCache()
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, version=_data_version)
+
+if WEBLOG_SHARED:
+    # Runs before the response cache checks the version, so every request sees
+    # rows written by any worker
+    @app.middleware("http")
+    async def catch_up_shared_log(request: Request, call_next):
+        ingest_log.catch_up(weblogs_db)
+        return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
@@ -52,23 +99,728 @@ class WeblogEntry(BaseModel):
     engagement_score: float
 
 
-# In-memory storage for weblogs 
-# Load initial data from visitor_weblogs.json
-with open('./visitor_weblogs.json', 'r') as f:
-    initial_data = json.load(f)
-    weblogs_db = [WeblogEntry(**entry) for entry in initial_data['weblogs']]
+class VisitorSummary(BaseModel):
+    visitor_id: str
+    total_page_views: int
+    average_engagement_score: float
+    average_time_on_page: float
+    last_visit_timestamp: datetime.datetime
+    is_converted: bool
+    conversion_type: Optional[str]
+    country: str
+    city: str
+    device_type: str
+
+
+class SessionSummary(BaseModel):
+    session_id: str
+    visitor_id: str
+    start: datetime.datetime
+    end: datetime.datetime
+    duration_seconds: float
+    page_views: int
+    total_time_on_page: int
+    average_engagement_score: float
+    entry_page: str
+    exit_page: str
+    is_bounce: bool
+    is_converted: bool
+    is_open: bool
+    device_type: str
+    country: str
+
+
+# Fields that can be filtered on with an equality match; each one gets a hash index
+INDEXED_FIELDS = ('country', 'visitor_id', 'session_id', 'device_type', 'page_visited', 'utm_source')
+
+# Seed data, and the binary snapshot of it that is reused while the file is unchanged
+SEED_FILE = './visitor_weblogs.json'
+SEED_SNAPSHOT = './visitor_weblogs.snapshot'
+# A prebuilt corpus (`python generate_weblogs.py corpus`) served instead of the seed data
+WEBLOG_CORPUS = os.environ.get("WEBLOG_CORPUS")
+
+
+class WeblogFile(BaseModel):
+    weblogs: List[WeblogEntry]
+
+
+def load_seed_store() -> WeblogStore:
+    """
+    Build the store from the seed snapshot when it is current, otherwise parse
+    the JSON seed file and write a fresh snapshot for the next start. When
+    WEBLOG_CORPUS is set, that corpus is memory-mapped instead.
+    """
+    if WEBLOG_CORPUS:
+        return WeblogStore.load(WeblogEntry, WEBLOG_CORPUS, indexed=INDEXED_FIELDS, mmap=True)
+
+    if snapshot_matches(read_manifest(SEED_SNAPSHOT), SEED_FILE):
+        try:
+            return WeblogStore.load(WeblogEntry, SEED_SNAPSHOT, indexed=INDEXED_FIELDS)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable snapshot {SEED_SNAPSHOT}: {e}")
+
+    store = WeblogStore(WeblogEntry, indexed=INDEXED_FIELDS)
+    with open(SEED_FILE, 'rb') as f:
+        store.extend(WeblogFile.model_validate_json(f.read()).weblogs)
+    try:
+        store.save(SEED_SNAPSHOT, {"source": file_fingerprint(SEED_FILE)})
+    except OSError as e:
+        print(f"Could not write snapshot {SEED_SNAPSHOT}: {e}")
+    return store
+
+
+# Durable log of every posted row, replayed on top of the seed data at startup
+WEBLOG_LOG_DIR = os.environ.get("WEBLOG_LOG_DIR", "./weblog_log")
+ingest_log = IngestLog(WEBLOG_LOG_DIR, WeblogEntry, shared=WEBLOG_SHARED)
+if WEBLOG_SHARED:
+    response_cache.instance = ingest_log.log_id
+
+# In-memory columnar storage for weblogs
+weblogs_db = load_seed_store()
+ingest_log.replay(weblogs_db)
+
+
+class _Lazy:
+    """
+    A derived structure built from the whole store on first use instead of at
+    startup. Until then it is not subscribed to the store, so appends skip it.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._value = None
+
+    def get(self):
+        if self._value is None:
+            self._value = self._build()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __len__(self):
+        return len(self.get())
+
+
+# The structures below each take seconds to build over a large store, so they
+# are built by the first request that needs them rather than at startup
+
+# N-gram search over visitor ids, locations and pages, updated on every insert
+search_index = _Lazy(lambda: SearchIndex(weblogs_db))
+# Per-visitor rollups, updated by the store on every insert
+visitor_rollups = _Lazy(lambda: VisitorRollups(weblogs_db, search_index.get()))
+# Per-dimension counters answering the common dashboard summaries without a scan
+weblog_aggregates = _Lazy(lambda: MaterializedAggregates(weblogs_db))
+# Distinct-count and percentile sketches per dimension value
+weblog_sketches = _Lazy(lambda: SketchAggregates(weblogs_db))
+# Sessions (rows grouped by session_id and split on idle gaps), updated on every insert
+session_table = _Lazy(lambda: SessionTable(weblogs_db))
+# Transitions, common paths and funnels over the session table
+session_paths = _Lazy(lambda: SessionPaths(session_table.get()))
+# Heatmap metrics per (city, country) for the Regional Reports page
+geo_aggregates = _Lazy(lambda: GeoAggregates(weblogs_db))
+# JSON bytes of every row, encoded once and joined into list responses
+encoded_rows = EncodedRowCache(weblogs_db)
+
+# Largest number of rows accepted by one POST /weblogs/batch request
+MAX_BATCH_SIZE = 50000
+
+_weblog_list_adapter = TypeAdapter(List[WeblogEntry])
+
+
+async def _ingest(weblogs: List[WeblogEntry]) -> range:
+    """
+    Make validated entries durable in the ingest log (group-committed with any
+    concurrent writes), then append them to the store, which updates every
+    index and rollup. Shared workers read them back from the log instead, so
+    rows land in log order along with anything other workers wrote meanwhile.
+    """
+    await ingest_log.append([weblog.model_dump_json().encode() + b"\n" for weblog in weblogs])
+    if WEBLOG_SHARED:
+        before = len(weblogs_db)
+        ingest_log.catch_up(weblogs_db)
+        return range(before, len(weblogs_db))
+    return weblogs_db.extend(weblogs)
+
+
+@app.on_event("shutdown")
+async def close_ingest_log():
+    await ingest_log.aclose()
+
 
 @app.post("/weblogs/")
 async def create_weblog_entry(weblog: WeblogEntry):
-    weblogs_db.append(weblog)
+    await _ingest([weblog])
     return {"message": "Weblog entry received", "weblog": weblog}
 
+
+def _row_errors(index: int, error: ValidationError) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "errors": [{"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]} for e in error.errors()],
+    }
+
+
+def _validate_rows(raw_rows: List[Any]):
+    """Validate rows one at a time; returns (valid entries, per-row errors)"""
+    valid, errors = [], []
+    for index, raw in enumerate(raw_rows):
+        try:
+            if isinstance(raw, (str, bytes)):
+                valid.append(WeblogEntry.model_validate_json(raw))
+            else:
+                valid.append(WeblogEntry.model_validate(raw))
+        except ValidationError as error:
+            errors.append(_row_errors(index, error))
+    return valid, errors
+
+
+@app.post("/weblogs/batch")
+async def create_weblog_batch(request: Request):
+    """
+    Accepts many weblog entries at once, either as a JSON array or as NDJSON
+    (one entry per line, `Content-Type: application/x-ndjson`). Valid rows are
+    appended in one operation; the response only reports counts and the
+    validation errors of rejected rows.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    if "ndjson" in content_type or not body.lstrip().startswith(b"["):
+        raw_rows = [line for line in body.splitlines() if line.strip()]
+        if len(raw_rows) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=413, detail=f"Batches are limited to {MAX_BATCH_SIZE} rows")
+        weblogs, errors = _validate_rows(raw_rows)
+    else:
+        try:
+            # Fast path: the whole array validates in a single pass
+            weblogs, errors = _weblog_list_adapter.validate_json(body), []
+            raw_rows = weblogs
+        except ValidationError:
+            try:
+                raw_rows = json.loads(body)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Body is not valid JSON")
+            if not isinstance(raw_rows, list):
+                raise HTTPException(status_code=400, detail="Expected a JSON array of weblog entries")
+            weblogs, errors = _validate_rows(raw_rows)
+        if len(raw_rows) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=413, detail=f"Batches are limited to {MAX_BATCH_SIZE} rows")
+
+    await _ingest(weblogs)
+    return {"received": len(raw_rows), "accepted": len(weblogs), "rejected": len(errors), "errors": errors}
+
+# Largest page a client may request with `limit`
+MAX_PAGE_SIZE = 10000
+# Rows serialized per chunk when streaming NDJSON
+STREAM_CHUNK_SIZE = 1000
+
+
+def _encode_cursor(row: int) -> str:
+    """Opaque cursor pointing just past the given row id"""
+    return base64.urlsafe_b64encode(str(row).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[set]:
+    """Validate a comma-separated `fields=` projection"""
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - set(WeblogEntry.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def _stream_ndjson(rows: np.ndarray, include: Optional[set]):
+    """Yield NDJSON chunks, materializing only STREAM_CHUNK_SIZE rows at a time"""
+    for start in range(0, len(rows), STREAM_CHUNK_SIZE):
+        chunk_rows = rows[start:start + STREAM_CHUNK_SIZE]
+        if include is None:
+            yield b"".join(line + b"\n" for line in encoded_rows.encoded(chunk_rows))
+        else:
+            chunk = weblogs_db.entries(chunk_rows)
+            yield "".join(entry.model_dump_json(include=include) + "\n" for entry in chunk)
+
+
+def _negotiate_encoding(request: Request) -> Optional[str]:
+    """Pick gzip or deflate from the Accept-Encoding header, if the client allows either"""
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("gzip", "deflate"):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _columnar_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """Render a columnar payload, compressed with gzip or deflate when the client accepts it"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = _negotiate_encoding(request)
+    if encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    elif encoding == "deflate":
+        body = zlib.compress(body, 6)
+        headers["Content-Encoding"] = "deflate"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def weblog_filters(
+    country: Optional[str] = None,
+    visitor_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    device_type: Optional[str] = None,
+    page_visited: Optional[str] = None,
+    utm_source: Optional[str] = None,
+) -> Dict[str, str]:
+    """Equality filters on the indexed fields shared by the read endpoints"""
+    conditions = {
+        "country": country,
+        "visitor_id": visitor_id,
+        "session_id": session_id,
+        "device_type": device_type,
+        "page_visited": page_visited,
+        "utm_source": utm_source,
+    }
+    return {field: value for field, value in conditions.items() if value}
+
+
+def time_bounds(
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+) -> Dict[str, int]:
+    """Inclusive timestamp bounds shared by the read endpoints, as epoch microseconds"""
+    bounds = {}
+    if since is not None:
+        bounds["since"] = to_epoch_us(since)
+    if until is not None:
+        bounds["until"] = to_epoch_us(until)
+    return bounds
+
+
+def _parse_field_list(value: str, allowed: List[str]) -> List[str]:
+    """Split a comma-separated list of field names, rejecting any not in `allowed`"""
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported fields: {', '.join(unknown)}")
+    return names
+
+
 @app.get("/weblogs/")
-async def get_all_weblogs(country: Optional[str] = None):
-    if country:
-        filtered_weblogs = [log for log in weblogs_db if log.country == country]
-        return {"weblogs": filtered_weblogs}
-    return {"weblogs": weblogs_db}
+async def get_all_weblogs(
+    request: Request,
+    conditions: Dict[str, str] = Depends(weblog_filters),
+    bounds: Dict[str, int] = Depends(time_bounds),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson|columnar)$"),
+):
+    """
+    Returns weblog entries, optionally filtered by exact match on the indexed fields
+    and by an inclusive `since`/`until` timestamp range (answered from the time index).
+    `limit`/`cursor` page through the result in insertion order, `fields` projects
+    each entry onto a comma-separated subset of keys, `format=ndjson` streams
+    one JSON object per line instead of building a single document, and
+    `format=columnar` returns one (dictionary-encoded) array per field,
+    gzip/deflate-compressed when the client accepts it.
+    """
+    include = _parse_fields(fields)
+    rows = weblogs_db.filter(**bounds, **conditions)
+
+    paginated = limit is not None or cursor is not None
+    if cursor is not None:
+        rows = rows[np.searchsorted(rows, _decode_cursor(cursor), side="right"):]
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(int(rows[-1]))
+
+    if response_format == "ndjson":
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return StreamingResponse(
+            _stream_ndjson(rows, include), media_type="application/x-ndjson", headers=headers
+        )
+
+    if response_format == "columnar":
+        fields_order = [name for name in WeblogEntry.model_fields if include is None or name in include]
+        payload = weblogs_db.columnar(rows, fields_order)
+        if paginated:
+            payload["next_cursor"] = next_cursor
+        return _columnar_response(request, payload)
+
+    if include is not None:
+        weblogs = [entry.model_dump(mode="json", include=include) for entry in weblogs_db.entries(rows)]
+        if paginated:
+            return {"weblogs": weblogs, "next_cursor": next_cursor}
+        return {"weblogs": weblogs}
+
+    # Full rows: join the pre-encoded bytes instead of serializing every model
+    body = b'{"weblogs":' + encoded_rows.json_array(rows)
+    if paginated:
+        body += b',"next_cursor":' + json.dumps(next_cursor).encode()
+    return Response(body + b"}", media_type="application/json")
+
+@app.get("/stats/group-by")
+async def group_weblogs(
+    by: str = "country",
+    top: str = "device_type,operating_system,referrer",
+    k: int = Query(3, ge=1, le=50),
+    conditions: Dict[str, str] = Depends(weblog_filters),
+    bounds: Dict[str, int] = Depends(time_bounds),
+):
+    """
+    Aggregates weblogs grouped by one or more comma-separated string fields
+    (e.g. `by=country` or `by=country,city`). Each group reports its count,
+    distinct visitors, sum and mean of the numeric fields, conversion and
+    bounce rates, and the `k` most common values of each field in `top`.
+    """
+    allowed = analytics.string_fields(weblogs_db)
+    keys = _parse_field_list(by, allowed)
+    if not keys:
+        raise HTTPException(status_code=400, detail="At least one group key is required")
+    top_fields = _parse_field_list(top, allowed)
+    rows = weblogs_db.filter(**bounds, **conditions)
+    return {"by": keys, "groups": analytics.group_by(weblogs_db, rows, keys, top_fields, k)}
+
+class TimeBucket(BaseModel):
+    bucket_start: datetime.datetime
+    count: int
+    conversion_rate: float
+    mean: Dict[str, float]
+
+
+@app.get("/stats/timeseries")
+async def weblog_timeseries(
+    interval: str = Query("hour", pattern="^(" + "|".join(analytics.INTERVALS) + ")$"),
+    metric: str = "engagement_score",
+    conditions: Dict[str, str] = Depends(weblog_filters),
+    bounds: Dict[str, int] = Depends(time_bounds),
+):
+    """
+    Returns page views bucketed by minute, hour or day (UTC), with each bucket's
+    conversion rate and the mean of every comma-separated numeric `metric`.
+    Accepts the same filters and `since`/`until` range as GET /weblogs/.
+    """
+    metrics = _parse_field_list(metric, analytics.numeric_fields(weblogs_db))
+    rows = weblogs_db.filter(**bounds, **conditions)
+    buckets = [TimeBucket(**bucket) for bucket in analytics.timeseries(weblogs_db, rows, interval, metrics)]
+    return {"interval": interval, "buckets": buckets}
+
+
+@app.get("/stats/summary")
+async def summarize_weblogs(
+    by: Optional[str] = Query(None, pattern="^(" + "|".join(AGGREGATE_DIMENSIONS) + ")$"),
+):
+    """
+    Returns count, sum, mean and standard deviation of the numeric fields plus
+    conversion and bounce rates, overall or per value of `by`. These come from
+    counters updated on every insert, so no rows are scanned.
+    """
+    return {"by": by, "groups": weblog_aggregates.summary(by)}
+
+
+class GeoLocation(BaseModel):
+    city: str
+    country: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    page_views: int
+    sessions: int
+    avg_engagement: float
+    avg_session_time: float
+    page_traffic: Dict[str, int]
+
+
+@app.get("/stats/geo")
+async def geo_stats():
+    """
+    Returns every (city, country) with its coordinates and all heatmap metrics:
+    average engagement score, average time per session (the mean of each
+    session's average time on page) and page views per page. The `max` of each
+    metric across locations is included so clients can normalize intensities.
+    Metrics are kept current on every insert, so no rows are scanned.
+    """
+    locations = [GeoLocation(**location) for location in geo_aggregates.locations_summary()]
+    page_traffic_max: Dict[str, int] = {}
+    for location in locations:
+        for page, count in location.page_traffic.items():
+            page_traffic_max[page] = max(page_traffic_max.get(page, 0), count)
+    return {
+        "locations": locations,
+        "max": {
+            "avg_engagement": max((location.avg_engagement for location in locations), default=0.0),
+            "avg_session_time": max((location.avg_session_time for location in locations), default=0.0),
+            "page_traffic": page_traffic_max,
+        },
+    }
+
+
+@app.get("/stats/paths")
+async def path_stats(
+    funnel: Optional[str] = None,
+    top: int = Query(10, ge=1, le=1000),
+    depth: Optional[int] = Query(None, ge=1),
+    transitions: Optional[int] = Query(None, ge=1),
+    visitor_id: Optional[str] = None,
+    device_type: Optional[str] = None,
+    country: Optional[str] = None,
+    bounds: Dict[str, int] = Depends(time_bounds),
+):
+    """
+    Returns the observed page-to-page transitions (optionally only the
+    `transitions` most frequent), the `top` most common session paths (cut to
+    their first `depth` pages if given) and, for a comma-separated `funnel`
+    such as `/,/pricing,/contact`, the sessions reaching each step in order.
+    Sessions can be narrowed like GET /sessions; `since`/`until` bound their start.
+    """
+    selected = None
+    if visitor_id is not None or device_type is not None or country is not None or bounds:
+        selected = session_table.query(visitor_id=visitor_id, device_type=device_type, country=country, **bounds)
+    steps = [page.strip() for page in funnel.split(",") if page.strip()] if funnel else []
+    return {
+        "sessions": len(session_table) if selected is None else len(selected),
+        "transitions": session_paths.transitions(selected, top=transitions),
+        "paths": session_paths.paths(selected, top=top, depth=depth),
+        "funnel": session_paths.funnel(steps, selected) if steps else None,
+    }
+
+
+@app.get("/stats/sketches")
+async def sketch_stats(
+    by: Optional[str] = Query(None, pattern="^(" + "|".join(SKETCH_DIMENSIONS) + ")$"),
+    percentiles: str = "50,95,99",
+):
+    """
+    Returns estimated distinct visitors and sessions (HyperLogLog) and
+    percentiles of page load time and time on page (within 1% relative error),
+    overall or per value of `by`. The sketches have a fixed size and are
+    updated on every insert, so the cost does not grow with the log.
+    """
+    try:
+        points = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        points = []
+    if not points or any(not 0 <= p <= 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers between 0 and 100")
+    return {"by": by, "groups": weblog_sketches.summary(by, points)}
+
+
+@app.get("/search")
+async def search_visitors(
+    q: str = Query(..., min_length=1),
+    fields: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Returns the ids of visitors with any row whose visitor_id, city, region,
+    country, page, page title or UTM source contains `q` (case-insensitive),
+    in order of first appearance. `fields` restricts the search to a
+    comma-separated subset. Answered from an n-gram index over the distinct
+    values, so the cost does not depend on the number of rows.
+    """
+    search_fields = _parse_field_list(fields, SEARCH_FIELDS) if fields else None
+    codes = search_index.search(q, search_fields)
+    page = codes[offset:offset + limit].tolist()
+    visitor_ids = weblogs_db.dictionary("visitor_id")
+    return {
+        "query": q,
+        "total": len(codes),
+        "offset": offset,
+        "limit": limit,
+        "visitor_ids": [visitor_ids[code] for code in page],
+    }
+
+
+@app.get("/visitors")
+async def list_visitors(
+    request: Request,
+    search: Optional[str] = None,
+    device_type: Optional[str] = None,
+    converted: Optional[bool] = None,
+    min_engagement: Optional[float] = None,
+    max_engagement: Optional[float] = None,
+    last_visit_from: Optional[datetime.datetime] = None,
+    last_visit_to: Optional[datetime.datetime] = None,
+    min_avg_time: Optional[float] = None,
+    max_avg_time: Optional[float] = None,
+    sort: str = Query("last_visit_desc", pattern="^(" + "|".join(VISITOR_SORT_KEYS) + ")$"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    response_format: str = Query("json", alias="format", pattern="^(json|columnar)$"),
+):
+    """
+    Returns one summary per visitor (page views, average engagement and time on
+    page, last visit, conversion, latest location and device), filtered, sorted
+    and paged on the server from incrementally maintained rollups.
+    `format=columnar` returns the visitors as one array per field, as on GET /weblogs/.
+    """
+    codes = visitor_rollups.query(
+        search=search,
+        device_type=device_type,
+        converted=converted,
+        min_engagement=min_engagement,
+        max_engagement=max_engagement,
+        last_visit_from=to_epoch_us(last_visit_from) if last_visit_from else None,
+        last_visit_to=to_epoch_us(last_visit_to) if last_visit_to else None,
+        min_avg_time=min_avg_time,
+        max_avg_time=max_avg_time,
+        sort=sort,
+    )
+    page = codes[offset:offset + limit]
+    visitors = [VisitorSummary(**summary) for summary in visitor_rollups.summaries(page)]
+    if response_format == "columnar":
+        return _columnar_response(request, {
+            "total": len(codes), "offset": offset, "limit": limit,
+            "visitors": columnar_records(VisitorSummary, visitors),
+        })
+    return {"total": len(codes), "offset": offset, "limit": limit, "visitors": visitors}
+
+@app.get("/sessions")
+async def list_sessions(
+    request: Request,
+    session_id: Optional[str] = None,
+    visitor_id: Optional[str] = None,
+    device_type: Optional[str] = None,
+    country: Optional[str] = None,
+    entry_page: Optional[str] = None,
+    exit_page: Optional[str] = None,
+    converted: Optional[bool] = None,
+    bounced: Optional[bool] = None,
+    is_open: Optional[bool] = None,
+    min_page_views: Optional[int] = None,
+    max_page_views: Optional[int] = None,
+    min_duration: Optional[float] = None,
+    max_duration: Optional[float] = None,
+    bounds: Dict[str, int] = Depends(time_bounds),
+    sort: str = Query("start_desc", pattern="^(" + "|".join(SESSION_SORT_KEYS) + ")$"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    response_format: str = Query("json", alias="format", pattern="^(json|columnar)$"),
+):
+    """
+    Returns sessions (duration, depth, entry and exit page, bounce, conversion)
+    with aggregates over every matching session. `since`/`until` bound the
+    session start. Served from the incrementally maintained session table.
+    `format=columnar` returns the sessions as one array per field, as on GET /weblogs/.
+    """
+    sessions = session_table.query(
+        session_id=session_id,
+        visitor_id=visitor_id,
+        device_type=device_type,
+        country=country,
+        entry_page=entry_page,
+        exit_page=exit_page,
+        converted=converted,
+        bounced=bounced,
+        is_open=is_open,
+        min_page_views=min_page_views,
+        max_page_views=max_page_views,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        sort=sort,
+        **bounds,
+    )
+    page = sessions[offset:offset + limit]
+    summaries = [SessionSummary(**summary) for summary in session_table.summaries(page)]
+    payload = {
+        "total": len(sessions),
+        "offset": offset,
+        "limit": limit,
+        "aggregates": session_table.aggregate(sessions),
+    }
+    if response_format == "columnar":
+        payload["sessions"] = columnar_records(SessionSummary, summaries)
+        return _columnar_response(request, payload)
+    payload["sessions"] = summaries
+    return payload
+
+
+def _visitor_rows(
+    visitor_id: str,
+    start_date: Optional[datetime.datetime],
+    end_date: Optional[datetime.datetime],
+    min_time_spent: Optional[int],
+    max_time_spent: Optional[int],
+) -> np.ndarray:
+    """Rows of one visitor in timestamp order, narrowed by optional date and time-spent bounds"""
+    if weblogs_db.code_of("visitor_id", visitor_id) is None:
+        raise HTTPException(status_code=404, detail="Visitor not found")
+    rows = weblogs_db.filter(visitor_id=visitor_id)
+    timestamps = weblogs_db.column("timestamp")[rows]
+    times = weblogs_db.column("time_on_page_seconds")[rows]
+    keep = np.ones(len(rows), dtype=bool)
+    if start_date is not None:
+        keep &= timestamps >= to_epoch_us(start_date)
+    if end_date is not None:
+        keep &= timestamps <= to_epoch_us(end_date)
+    if min_time_spent is not None:
+        keep &= times >= min_time_spent
+    if max_time_spent is not None:
+        keep &= times <= max_time_spent
+    rows, timestamps = rows[keep], timestamps[keep]
+    return rows[np.argsort(timestamps, kind="stable")]
+
+
+@app.get("/visitors/{visitor_id}")
+async def get_visitor(
+    request: Request,
+    visitor_id: str,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    min_time_spent: Optional[int] = None,
+    max_time_spent: Optional[int] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|columnar)$"),
+):
+    """
+    Returns one visitor's summary and visit history (oldest first), using the
+    visitor_id index so the cost depends only on that visitor's rows.
+    `format=columnar` returns the history as one array per field, as on GET /weblogs/.
+    """
+    rows = _visitor_rows(visitor_id, start_date, end_date, min_time_spent, max_time_spent)
+    code = weblogs_db.code_of("visitor_id", visitor_id)
+    summary = VisitorSummary(**visitor_rollups.summaries(np.array([code]))[0])
+    if response_format == "columnar":
+        return _columnar_response(request, {
+            "visitor": summary.model_dump(mode="json"),
+            "weblogs": weblogs_db.columnar(rows, list(WeblogEntry.model_fields)),
+        })
+    return {"visitor": summary, "weblogs": weblogs_db.entries(rows)}
+
+
+@app.get("/visitors/{visitor_id}/page-stats")
+async def get_visitor_page_stats(
+    visitor_id: str,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    min_time_spent: Optional[int] = None,
+    max_time_spent: Optional[int] = None,
+):
+    """
+    Returns mean, median, mode and standard deviation of time on page for each
+    page the visitor viewed, within the optional date and time-spent bounds.
+    """
+    rows = _visitor_rows(visitor_id, start_date, end_date, min_time_spent, max_time_spent)
+    return {"visitor_id": visitor_id, "pages": analytics.page_time_stats(weblogs_db, rows)}
 
 @app.get("/")
 async def read_root():
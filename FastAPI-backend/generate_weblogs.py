@@ -1,15 +1,155 @@
+import argparse
+import heapq
+import itertools
 import json
+import os
 import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from datetime import datetime, timedelta
 import secrets
 from collections import defaultdict
 import math
+from weblog_store import write_snapshot
+
+# Order of the fields in every generated weblog entry
+WEBLOG_FIELDS = [
+    'timestamp', 'visitor_id', 'session_id', 'page_visited', 'page_title', 'ip_address',
+    'user_agent', 'referrer', 'language', 'screen_resolution', 'viewport_size', 'device_type',
+    'operating_system', 'browser', 'country', 'region', 'city', 'isp', 'utm_source',
+    'utm_medium', 'utm_campaign', 'page_load_time_ms', 'time_on_page_seconds',
+    'scroll_depth_percent', 'clicks_count', 'is_bounce', 'is_converted', 'conversion_type',
+    'engagement_score'
+]
+
+# Upper bound on the number of pages in one journey
+MAX_JOURNEY_STEPS = 8
+
+# Entries held in memory per sorted run when streaming
+RUN_SIZE = 100_000
+# Most runs merged at once; more runs are merged in several passes
+MERGE_FAN_IN = 64
+# Users per independently seeded block in parallel generation; fixed so the
+# output does not depend on the number of workers
+BLOCK_USERS = 5_000
+
+# Preset benchmark corpora, in rows. Blocks are seeded independently, so with
+# the same seed each corpus holds the first visitors of the larger ones
+CORPUS_SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+CORPUS_SEED = 20240315
+# Page views per user on average, used to size each wave of corpus blocks
+EXPECTED_ROWS_PER_USER = 15
+
+
+def _draw_grouped(rng, samplers, groups):
+    """
+    One draw per element from the SamplingTable of its group, where
+    `samplers[g]` is a (table, codes) pair translating the table's item
+    indexes into codes; each group's draws come from one `indexes` call.
+    """
+    groups = np.asarray(groups)
+    drawn = np.empty(len(groups), dtype=np.int64)
+    order = np.argsort(groups, kind='stable')
+    bounds = np.searchsorted(groups[order], np.arange(len(samplers) + 1))
+    for g, (table, codes) in enumerate(samplers):
+        members = order[bounds[g]:bounds[g + 1]]
+        if len(members):
+            drawn[members] = codes[table.indexes(len(members), rng)]
+    return drawn
+
+
+def _flatten(groups):
+    """Concatenate lists of options, returning the flat list and each group's offset and length"""
+    flat, offsets, lengths = [], [], []
+    for options in groups:
+        offsets.append(len(flat))
+        lengths.append(len(options))
+        flat.extend(options)
+    return flat, np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
+def _choose_within(rng, offsets, lengths, groups):
+    """Uniform choice of one option from the group of each element, as flat indexes"""
+    return offsets[groups] + (rng.random(len(groups)) * lengths[groups]).astype(np.int64)
+
+
+def _encode(table, codes):
+    """Dictionary-encode `codes` into `table`, merging repeated values of the table"""
+    values, remap = [], {}
+    lookup = np.empty(len(table), dtype=np.int32)
+    for i, value in enumerate(table):
+        code = remap.get(value)
+        if code is None:
+            code = remap[value] = len(values)
+            values.append(value)
+        lookup[i] = code
+    return values, lookup[codes]
+
+
+class SamplingTable:
+    """
+    Walker alias table over a weighted dictionary, compiled once.
+
+    Accepts the same dictionaries as WeblogGenerator.weighted_choice (item ->
+    weight, or item -> {'weight': ...}). Each draw costs one uniform number
+    and one comparison whatever the number of items.
+    """
+
+    def __init__(self, choices):
+        self.items = list(choices)
+        weights = np.array([
+            choices[item].get('weight', 1) if isinstance(choices[item], dict) else choices[item]
+            for item in self.items
+        ], dtype=np.float64)
+        self.probabilities = weights / weights.sum()
+
+        # Vose's method: split every item's scaled probability into one slot
+        # shared with at most one heavier item
+        n = len(self.items)
+        scaled = self.probabilities * n
+        threshold = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1]
+        large = [i for i in range(n) if scaled[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            threshold[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        self.threshold = threshold
+        self.alias = alias
+        self._threshold = threshold.tolist()
+        self._alias = alias.tolist()
+
+    def __len__(self):
+        return len(self.items)
+
+    def index(self):
+        """Index of one item, drawn with the `random` module"""
+        u = random.random() * len(self._alias)
+        slot = min(int(u), len(self._alias) - 1)
+        return slot if u - slot < self._threshold[slot] else self._alias[slot]
+
+    def indexes(self, k, rng=None):
+        """Indexes of `k` items as an array, drawn from `rng` (a np.random.Generator) or np.random"""
+        u = (rng.random(k) if rng is not None else np.random.random(k)) * len(self.alias)
+        slot = np.minimum(u.astype(np.int64), len(self.alias) - 1)
+        return np.where(u - slot < self.threshold[slot], slot, self.alias[slot])
+
+    def sample(self, k=None):
+        """One item, or a list of `k` items"""
+        if k is None:
+            return self.items[self.index()]
+        return [self.items[self.index()] for _ in range(k)]
+
 
 class WeblogGenerator:
     def __init__(self):
         self.setup_data_structures()
         self.setup_probability_distributions()
+        self.setup_batch_tables()
     
     def setup_data_structures(self):
         """Setup all the data structures and mappings"""
@@ -488,6 +628,81 @@ class WeblogGenerator:
         
         self.conversion_types = ['whitepaper_download', 'contact_form', 'demo_request', 'newsletter_signup']
         self.languages = ['en-US', 'en-GB', 'en-CA', 'fr-FR', 'de-DE', 'es-ES', 'en-AU']
+        
+        # User behavior patterns
+        self.user_types = {
+            'researcher': {'weight': 0.3, 'session_frequency': 'high', 'conversion_likelihood': 'low'},
+            'evaluator': {'weight': 0.25, 'session_frequency': 'medium', 'conversion_likelihood': 'medium'},
+            'buyer': {'weight': 0.15, 'session_frequency': 'low', 'conversion_likelihood': 'high'},
+            'casual': {'weight': 0.2, 'session_frequency': 'low', 'conversion_likelihood': 'very_low'},
+            'returning_customer': {'weight': 0.1, 'session_frequency': 'medium', 'conversion_likelihood': 'medium'}
+        }
+        
+        # Day of week weights (Monday=0), less traffic on weekends
+        self.day_weights = {0: 0.8, 1: 1.2, 2: 1.3, 3: 1.3, 4: 1.2, 5: 0.9, 6: 0.7}
+        
+        # Clicks per page view by page type
+        self.click_weights = {
+            'contact': {1: 0.3, 2: 0.4, 3: 0.2, 4: 0.1},
+            'product': {0: 0.2, 1: 0.4, 2: 0.3, 3: 0.1},
+            'other': {0: 0.5, 1: 0.4, 2: 0.1}
+        }
+        
+        self.compile_sampling_tables()
+    
+    def compile_sampling_tables(self):
+        """Compile every weighted dictionary above into a SamplingTable"""
+        # The country -> region -> city hierarchy as one table over
+        # (country, region, city) with the joint probability of each
+        locations = {}
+        country_total = sum(c['weight'] for c in self.location_data.values())
+        for country, country_data in self.location_data.items():
+            region_total = sum(r['weight'] for r in country_data['regions'].values())
+            for region, region_data in country_data['regions'].items():
+                city_total = sum(city['weight'] for city in region_data['cities'].values())
+                for city, city_data in region_data['cities'].items():
+                    locations[(country, region, city)] = (
+                        country_data['weight'] / country_total
+                        * region_data['weight'] / region_total
+                        * city_data['weight'] / city_total
+                    )
+        # Every tech affinity a city can hand to generate_device_info, and the default
+        tech_affinities = {0.75} | {
+            city['tech_affinity']
+            for country in self.location_data.values()
+            for region in country['regions'].values()
+            for city in region['cities'].values()
+        }
+        
+        self.sampling_tables = {
+            'locations': SamplingTable(locations),
+            'devices': {affinity: SamplingTable(self.device_weights(affinity)) for affinity in tech_affinities},
+            'browsers': {d: SamplingTable(data['browsers']) for d, data in self.device_browser_data.items()},
+            'operating_systems': {d: SamplingTable(data['operating_systems']) for d, data in self.device_browser_data.items()},
+            'utm_sources': SamplingTable(self.marketing_data['utm_sources']),
+            'referrers': SamplingTable(self.marketing_data['referrers']),
+            'next_pages': {page: SamplingTable(data['next_pages']) for page, data in self.page_data.items()},
+            'clicks': {kind: SamplingTable(weights) for kind, weights in self.click_weights.items()},
+            'user_types': SamplingTable(self.user_types),
+            'days': SamplingTable(self.day_weights)
+        }
+    
+    def page_kind(self, page):
+        """Page type used for click counts: 'contact', 'product' or 'other'"""
+        if page == '/contact':
+            return 'contact'
+        if page in ['/pricing', '/products/chatbot-solutions']:
+            return 'product'
+        return 'other'
+    
+    def device_weights(self, tech_affinity=0.75):
+        """Device type weights for a tech affinity"""
+        # Higher tech affinity = more likely to use newer devices/browsers
+        return {
+            'desktop': 0.65 + (tech_affinity - 0.75) * 0.1,
+            'mobile': 0.28 - (tech_affinity - 0.75) * 0.05,
+            'tablet': 0.07 - (tech_affinity - 0.75) * 0.05
+        }
     
     def setup_probability_distributions(self):
         """Setup probability distributions for various metrics"""
@@ -498,16 +713,152 @@ class WeblogGenerator:
             'session_duration_std': 5
         }
     
-    def weighted_choice(self, choices):
-        """Make a weighted random choice from a dictionary with weights"""
-        if isinstance(choices, dict):
-            items = list(choices.keys())
-            weights = [choices[item].get('weight', 1) if isinstance(choices[item], dict) else choices[item] for item in items]
-        else:
-            items = list(choices.keys())
-            weights = list(choices.values())
-        
-        return random.choices(items, weights=weights, k=1)[0]
+    def setup_batch_tables(self):
+        """Precompile the weight tables and per-page parameters used by batch generation"""
+        # Locations by index into the joint (country, region, city) table
+        countries = list(self.location_data)
+        locations = self.sampling_tables['locations'].items
+        regions = list(dict.fromkeys((country, region) for country, region, _ in locations))
+        city_country = [countries.index(country) for country, _, _ in locations]
+        city_region = [regions.index((country, region)) for country, region, _ in locations]
+        tech_affinity = [
+            self.location_data[country]['regions'][region]['cities'][city]['tech_affinity']
+            for country, region, city in locations
+        ]
+        isps, isp_offsets, isp_counts = _flatten([self.location_data[c]['isps'] for c in countries])
+        zones, zone_offsets, zone_counts = _flatten([self.location_data[c]['timezone_offset'] for c in countries])
+        language_options = {
+            'United States': ['en-US'],
+            'United Kingdom': ['en-GB'],
+            'Canada': ['en-CA', 'fr-FR'],
+            'Australia': ['en-AU'],
+            'Germany': ['de-DE'],
+            'France': ['fr-FR'],
+            'Spain': ['es-ES']
+        }
+        languages, language_offsets, language_counts = _flatten([language_options.get(c, ['en-US']) for c in countries])
+        ip_ranges = {
+            'United States': '192.168',
+            'United Kingdom': '10.0',
+            'Germany': '172.16',
+            'Canada': '192.168',
+            'Australia': '10.1',
+            'France': '172.17',
+            'Spain': '10.2'
+        }
+        affinities = sorted(self.sampling_tables['devices'])
+        self.location_table = {
+            'countries': countries,
+            'regions': [region for _, region in regions],
+            'cities': [city for _, _, city in locations],
+            'city_country': np.array(city_country),
+            'city_region': np.array(city_region),
+            'tech_affinity': np.array(tech_affinity),
+            # Index of each city's affinity in device_table['devices_by_affinity']
+            'affinity_group': np.array([affinities.index(a) for a in tech_affinity]),
+            'isps': (isps, isp_offsets, isp_counts),
+            'timezones': (np.array(zones), zone_offsets, zone_counts),
+            'languages': (languages, language_offsets, language_counts),
+            'ip_bases': [ip_ranges.get(c, '192.168') for c in countries]
+        }
+
+        # Devices, with the compiled device, browser and operating system
+        # tables paired with codes over all devices, browsers and systems
+        devices = list(self.device_browser_data)
+        browsers, browser_versions, operating_systems = [], [], []
+        for device, device_data in self.device_browser_data.items():
+            for browser, browser_data in device_data['browsers'].items():
+                browsers.append((device, browser))
+                browser_versions.append(browser_data['versions'])
+            operating_systems.extend(device_data['operating_systems'])
+        os_names = list(dict.fromkeys(operating_systems))
+        tables = self.sampling_tables
+        self.device_table = {
+            'devices': devices,
+            'browsers': browsers,
+            'versions': _flatten(browser_versions),
+            'operating_systems': os_names,
+            'devices_by_affinity': [
+                (tables['devices'][a], np.array([devices.index(d) for d in tables['devices'][a].items]))
+                for a in affinities
+            ],
+            'browsers_by_device': [
+                (tables['browsers'][d], np.array([browsers.index((d, b)) for b in tables['browsers'][d].items]))
+                for d in devices
+            ],
+            'operating_systems_by_device': [
+                (tables['operating_systems'][d], np.array([os_names.index(o) for o in tables['operating_systems'][d].items]))
+                for d in devices
+            ],
+            'screens': _flatten([self.device_browser_data[d]['screen_resolutions'] for d in devices]),
+            'viewports': _flatten([self.device_browser_data[d]['viewport_sizes'] for d in devices])
+        }
+
+        # User types, indexed as in sampling_tables['user_types']: sessions
+        # per user and behavior patterns by session frequency
+        user_types = self.sampling_tables['user_types'].items
+        frequencies = [self.user_types[t]['session_frequency'] for t in user_types]
+        session_ranges = {'high': (8, 25), 'medium': (3, 12), 'low': (1, 6)}
+        patterns = ['business', 'normal', 'evening']
+        pattern_choices = {'high': ['business'], 'medium': ['business', 'normal'], 'low': ['normal', 'evening']}
+        self.user_table = {
+            'user_types': user_types,
+            'sessions': np.array([session_ranges[f] for f in frequencies]),
+            'patterns': _flatten([[patterns.index(p) for p in pattern_choices[f]] for f in frequencies]),
+            # Mean, deviation and clipping range of the visit hour per pattern
+            'hours': np.array([(13, 3, 9, 17), (14, 4, 0, 23), (20, 2, 18, 23)], dtype=np.float64),
+            'conversion_multiplier': np.array([{'high_intent': 2.0, 'researcher': 0.5}.get(t, 1.0) for t in user_types])
+        }
+
+        # Traffic sources, with the entry pages each one lands on
+        sources = self.marketing_data['utm_sources']
+        source_names = list(sources)
+        entry_pages = {
+            'direct': ['/'],
+            'google': ['/', '/pricing', '/products/chatbot-solutions'],
+            'bing': ['/', '/products/customer-engagement'],
+            'linkedin': ['/solutions/enterprise', '/about/careers'],
+            'newsletter': ['/blog/ai-customer-service-trends', '/resources/whitepapers'],
+            'twitter': ['/blog/ai-customer-service-trends'],
+            'facebook': ['/']
+        }
+        pages = list(self.page_data)
+        self.marketing_table = {
+            'sources': source_names,
+            'mediums': _flatten([sources[s]['mediums'] for s in source_names]),
+            'campaigns': _flatten([sources[s]['campaigns'] for s in source_names]),
+            'entry_pages': _flatten([[pages.index(p) for p in entry_pages.get(s, ['/'])] for s in source_names]),
+            'referrers': self.sampling_tables['referrers'].items
+        }
+
+        # Pages: parameters by page index, next-page tables with 'exit' coded
+        # as len(pages), and click count tables by page kind
+        kinds = list(self.click_weights)
+        self.page_table = {
+            'pages': pages,
+            'titles': [self.page_data[p]['title'] for p in pages],
+            'contact': pages.index('/contact'),
+            'conversion_probability': np.array([self.page_data[p]['conversion_probability'] for p in pages]),
+            'avg_time_on_page': np.array([self.page_data[p]['avg_time_on_page'] for p in pages], dtype=np.float64),
+            'bounce_probability': np.array([self.page_data[p]['bounce_probability'] for p in pages]),
+            'next_pages': [
+                (tables['next_pages'][page], np.array([
+                    len(pages) if p == 'exit' else pages.index(p) for p in tables['next_pages'][page].items
+                ]))
+                for page in pages
+            ],
+            'kind': np.array([kinds.index(self.page_kind(page)) for page in pages]),
+            'clicks_by_kind': [(tables['clicks'][kind], np.array(tables['clicks'][kind].items)) for kind in kinds]
+        }
+    
+    def weighted_choice(self, choices, k=None):
+        """
+        Make a weighted random choice from a dictionary with weights or a
+        precompiled SamplingTable; returns a list of `k` choices if given.
+        Dictionaries are compiled on every call, so hot paths pass tables.
+        """
+        table = choices if isinstance(choices, SamplingTable) else SamplingTable(choices)
+        return table.sample(k)
     
     def generate_realistic_timestamp(self, start_time, timezone_offset=0, user_behavior_pattern='normal'):
         """Generate realistic timestamps based on user behavior patterns"""
@@ -528,7 +879,7 @@ class WeblogGenerator:
             hour_bias = max(0, min(23, hour_bias))
         
         # Add day of week bias (less traffic on weekends)
-        day_bias = random.choices([0, 1, 2, 3, 4, 5, 6], weights=[0.8, 1.2, 1.3, 1.3, 1.2, 0.9, 0.7])[0]
+        day_bias = self.weighted_choice(self.sampling_tables['days'])
         
         # Calculate final timestamp
         random_days = random.randint(0, 30)  # Within 30 days
@@ -551,14 +902,9 @@ class WeblogGenerator:
     
     def generate_user_location(self):
         """Generate user location with realistic clustering"""
-        country = self.weighted_choice(self.location_data)
+        country, region, city = self.weighted_choice(self.sampling_tables['locations'])
         country_data = self.location_data[country]
-        
-        region = self.weighted_choice(country_data['regions'])
-        region_data = country_data['regions'][region]
-        
-        city = self.weighted_choice(region_data['cities'])
-        city_data = region_data['cities'][city]
+        city_data = country_data['regions'][region]['cities'][city]
         
         isp = random.choice(country_data['isps'])
         timezone_offset = random.choice(country_data['timezone_offset'])
@@ -574,20 +920,18 @@ class WeblogGenerator:
     
     def generate_device_info(self, tech_affinity=0.75):
         """Generate device information based on tech affinity"""
-        # Higher tech affinity = more likely to use newer devices/browsers
-        device_weights = {
-            'desktop': 0.65 + (tech_affinity - 0.75) * 0.1,
-            'mobile': 0.28 - (tech_affinity - 0.75) * 0.05,
-            'tablet': 0.07 - (tech_affinity - 0.75) * 0.05
-        }
-        
-        device_type = self.weighted_choice(device_weights)
+        tables = self.sampling_tables
+        devices = tables['devices'].get(tech_affinity)
+        if devices is None:
+            # Affinities outside location_data are compiled once and kept
+            devices = tables['devices'][tech_affinity] = SamplingTable(self.device_weights(tech_affinity))
+        device_type = self.weighted_choice(devices)
         device_data = self.device_browser_data[device_type]
         
-        browser = self.weighted_choice(device_data['browsers'])
+        browser = self.weighted_choice(tables['browsers'][device_type])
         browser_version = random.choice(device_data['browsers'][browser]['versions'])
         
-        os = self.weighted_choice(device_data['operating_systems'])
+        os = self.weighted_choice(tables['operating_systems'][device_type])
         screen_resolution = random.choice(device_data['screen_resolutions'])
         viewport_size = random.choice(device_data['viewport_sizes'])
         
@@ -628,14 +972,14 @@ class WeblogGenerator:
     
     def generate_marketing_attribution(self):
         """Generate realistic marketing attribution"""
-        utm_source = self.weighted_choice(self.marketing_data['utm_sources'])
+        utm_source = self.weighted_choice(self.sampling_tables['utm_sources'])
         source_data = self.marketing_data['utm_sources'][utm_source]
         
         utm_medium = random.choice(source_data['mediums'])
         utm_campaign = random.choice(source_data['campaigns'])
         
         # Generate referrer based on source
-        referrer = self.weighted_choice(self.marketing_data['referrers'])
+        referrer = self.weighted_choice(self.sampling_tables['referrers'])
         
         return {
             'utm_source': utm_source,
@@ -670,12 +1014,7 @@ class WeblogGenerator:
             scroll_depth = min(100, scroll_depth + int((tech_affinity - 0.75) * 20))
             
             # Calculate clicks based on page type and engagement
-            if current_page == '/contact':
-                clicks_count = random.choices([1, 2, 3, 4], weights=[0.3, 0.4, 0.2, 0.1])[0]
-            elif current_page in ['/pricing', '/products/chatbot-solutions']:
-                clicks_count = random.choices([0, 1, 2, 3], weights=[0.2, 0.4, 0.3, 0.1])[0]
-            else:
-                clicks_count = random.choices([0, 1, 2], weights=[0.5, 0.4, 0.1])[0]
+            clicks_count = self.weighted_choice(self.sampling_tables['clicks'][self.page_kind(current_page)])
             
             # Generate page load time (with some outliers)
             if random.random() < 0.05:  # 5% chance of slow load (outlier)
@@ -726,8 +1065,7 @@ class WeblogGenerator:
             if is_bounce or current_page == '/contact':
                 break
             
-            next_page_choices = page_data['next_pages']
-            next_page = self.weighted_choice(next_page_choices)
+            next_page = self.weighted_choice(self.sampling_tables['next_pages'][current_page])
             
             if next_page == 'exit':
                 break
@@ -758,17 +1096,8 @@ class WeblogGenerator:
         """Generate a comprehensive user profile with consistent behavior"""
         location = self.generate_user_location()
         
-        # User behavior patterns
-        user_types = {
-            'researcher': {'weight': 0.3, 'session_frequency': 'high', 'conversion_likelihood': 'low'},
-            'evaluator': {'weight': 0.25, 'session_frequency': 'medium', 'conversion_likelihood': 'medium'},
-            'buyer': {'weight': 0.15, 'session_frequency': 'low', 'conversion_likelihood': 'high'},
-            'casual': {'weight': 0.2, 'session_frequency': 'low', 'conversion_likelihood': 'very_low'},
-            'returning_customer': {'weight': 0.1, 'session_frequency': 'medium', 'conversion_likelihood': 'medium'}
-        }
-        
-        user_type = self.weighted_choice(user_types)
-        user_behavior = user_types[user_type]
+        user_type = self.weighted_choice(self.sampling_tables['user_types'])
+        user_behavior = self.user_types[user_type]
         
         # Generate consistent device info
         device_info = self.generate_device_info(location['tech_affinity'])
@@ -828,77 +1157,8 @@ class WeblogGenerator:
         
         # Generate sessions for each user
         for profile in user_profiles:
-            for session_num in range(profile['num_sessions']):
-                session_id = f"sess_{secrets.token_hex(8)}"
-                
-                # Generate session timestamp
-                session_start = self.generate_realistic_timestamp(
-                    start_date, 
-                    profile['location']['timezone_offset'],
-                    profile['behavior_pattern']
-                )
-                
-                # Generate marketing attribution for this session
-                marketing = self.generate_marketing_attribution()
-                
-                # Determine entry page based on marketing source
-                entry_pages = {
-                    'direct': ['/'],
-                    'google': ['/', '/pricing', '/products/chatbot-solutions'],
-                    'bing': ['/', '/products/customer-engagement'],
-                    'linkedin': ['/solutions/enterprise', '/about/careers'],
-                    'newsletter': ['/blog/ai-customer-service-trends', '/resources/whitepapers'],
-                    'twitter': ['/blog/ai-customer-service-trends'],
-                    'facebook': ['/']
-                }
-                
-                entry_page = random.choice(entry_pages.get(marketing['utm_source'], ['/']))
-                
-                # Generate user journey
-                journey = self.generate_user_journey(
-                    entry_page, 
-                    profile['location']['tech_affinity'],
-                    profile['user_type']
-                )
-                
-                # Create weblog entries for each page in the journey
-                for step, page_data in enumerate(journey):
-                    timestamp = session_start + timedelta(minutes=step * 2, seconds=random.randint(0, 120))
-
-                    weblog_entry = {
-                        "timestamp": timestamp.isoformat(timespec='milliseconds') + 'Z',
-                        "visitor_id": profile['user_id'],
-                        "session_id": session_id,
-                        "page_visited": page_data['page_visited'],
-                        "page_title": page_data['page_title'],
-                        "ip_address": profile['ip_address'],
-                        "user_agent": profile['device_info']['user_agent'],
-                        "referrer": marketing['referrer'],
-                        "language": profile['language'],
-                        "screen_resolution": profile['device_info']['screen_resolution'],
-                        "viewport_size": profile['device_info']['viewport_size'],
-                        "device_type": profile['device_info']['device_type'],
-                        "operating_system": profile['device_info']['operating_system'],
-                        "browser": profile['device_info']['browser'],
-                        "country": profile['location']['country'],
-                        "region": profile['location']['region'],
-                        "city": profile['location']['city'],
-                        "isp": profile['location']['isp'],
-                        "utm_source": marketing['utm_source'],
-                        "utm_medium": marketing['utm_medium'],
-                        "utm_campaign": marketing['utm_campaign'],
-                        "page_load_time_ms": page_data['page_load_time_ms'],
-                        "time_on_page_seconds": page_data['time_on_page_seconds'],
-                        "scroll_depth_percent": page_data['scroll_depth_percent'],
-                        "clicks_count": page_data['clicks_count'],
-                        "is_bounce": page_data['is_bounce'],
-                        "is_converted": page_data['is_converted'],
-                        "conversion_type": page_data['conversion_type'],
-                        "engagement_score": page_data['engagement_score']
-                    }
-                    
-                    weblogs.append(weblog_entry)
-            
+            weblogs.extend(self.generate_profile_weblogs(profile, start_date))
+        
             # Sort by timestamp to make data more realistic
         weblogs.sort(key=lambda x: x['timestamp'])
         
@@ -910,6 +1170,376 @@ class WeblogGenerator:
         
         return {"weblogs": weblogs}
 
+    def generate_profile_weblogs(self, profile, start_date):
+        """Yield the weblog entries of every session of one user profile, in generation order"""
+        for session_num in range(profile['num_sessions']):
+            session_id = f"sess_{secrets.token_hex(8)}"
+            
+            # Generate session timestamp
+            session_start = self.generate_realistic_timestamp(
+                start_date, 
+                profile['location']['timezone_offset'],
+                profile['behavior_pattern']
+            )
+            
+            # Generate marketing attribution for this session
+            marketing = self.generate_marketing_attribution()
+            
+            # Determine entry page based on marketing source
+            entry_pages = {
+                'direct': ['/'],
+                'google': ['/', '/pricing', '/products/chatbot-solutions'],
+                'bing': ['/', '/products/customer-engagement'],
+                'linkedin': ['/solutions/enterprise', '/about/careers'],
+                'newsletter': ['/blog/ai-customer-service-trends', '/resources/whitepapers'],
+                'twitter': ['/blog/ai-customer-service-trends'],
+                'facebook': ['/']
+            }
+            
+            entry_page = random.choice(entry_pages.get(marketing['utm_source'], ['/']))
+            
+            # Generate user journey
+            journey = self.generate_user_journey(
+                entry_page, 
+                profile['location']['tech_affinity'],
+                profile['user_type']
+            )
+            
+            # Create weblog entries for each page in the journey
+            for step, page_data in enumerate(journey):
+                timestamp = session_start + timedelta(minutes=step * 2, seconds=random.randint(0, 120))
+
+                weblog_entry = {
+                    "timestamp": timestamp.isoformat(timespec='milliseconds') + 'Z',
+                    "visitor_id": profile['user_id'],
+                    "session_id": session_id,
+                    "page_visited": page_data['page_visited'],
+                    "page_title": page_data['page_title'],
+                    "ip_address": profile['ip_address'],
+                    "user_agent": profile['device_info']['user_agent'],
+                    "referrer": marketing['referrer'],
+                    "language": profile['language'],
+                    "screen_resolution": profile['device_info']['screen_resolution'],
+                    "viewport_size": profile['device_info']['viewport_size'],
+                    "device_type": profile['device_info']['device_type'],
+                    "operating_system": profile['device_info']['operating_system'],
+                    "browser": profile['device_info']['browser'],
+                    "country": profile['location']['country'],
+                    "region": profile['location']['region'],
+                    "city": profile['location']['city'],
+                    "isp": profile['location']['isp'],
+                    "utm_source": marketing['utm_source'],
+                    "utm_medium": marketing['utm_medium'],
+                    "utm_campaign": marketing['utm_campaign'],
+                    "page_load_time_ms": page_data['page_load_time_ms'],
+                    "time_on_page_seconds": page_data['time_on_page_seconds'],
+                    "scroll_depth_percent": page_data['scroll_depth_percent'],
+                    "clicks_count": page_data['clicks_count'],
+                    "is_bounce": page_data['is_bounce'],
+                    "is_converted": page_data['is_converted'],
+                    "conversion_type": page_data['conversion_type'],
+                    "engagement_score": page_data['engagement_score']
+                }
+                
+                yield weblog_entry
+
+    def iter_synthetic_weblogs(self, num_users=20, start_date=None):
+        """
+        Yield weblog entries user by user, holding one profile at a time.
+
+        Entries come out in generation order, not time order; pass them
+        through sort_weblogs_external for time-sorted output.
+        """
+        if start_date is None:
+            start_date = datetime(2024, 3, 15, 0, 0, 0)
+        
+        for i in range(1, num_users + 1):
+            profile = self.generate_user_profile(f"visitor_{i:03d}")
+            yield from self.generate_profile_weblogs(profile, start_date)
+
+    def generate_batch_profiles(self, num_users, rng):
+        """Draw the profiles of a batch of users as arrays with one element per user"""
+        locations = self.location_table
+        city = self.sampling_tables['locations'].indexes(num_users, rng)
+        country = locations['city_country'][city]
+        tech_affinity = locations['tech_affinity'][city]
+        isp = _choose_within(rng, *locations['isps'][1:], country)
+        zones, zone_offsets, zone_counts = locations['timezones']
+        timezone_offset = zones[_choose_within(rng, zone_offsets, zone_counts, country)]
+        language = _choose_within(rng, *locations['languages'][1:], country)
+
+        users = self.user_table
+        user_type = self.sampling_tables['user_types'].indexes(num_users, rng)
+        low, high = users['sessions'][user_type].T
+        num_sessions = rng.integers(low, high + 1)
+        patterns, pattern_offsets, pattern_counts = users['patterns']
+        behavior_pattern = np.array(patterns)[_choose_within(rng, pattern_offsets, pattern_counts, user_type)]
+
+        devices = self.device_table
+        device = _draw_grouped(rng, devices['devices_by_affinity'], locations['affinity_group'][city])
+        browser = _draw_grouped(rng, devices['browsers_by_device'], device)
+        version = _choose_within(rng, *devices['versions'][1:], browser)
+        operating_system = _draw_grouped(rng, devices['operating_systems_by_device'], device)
+        screen = _choose_within(rng, *devices['screens'][1:], device)
+        viewport = _choose_within(rng, *devices['viewports'][1:], device)
+
+        return {
+            'city': city,
+            'country': country,
+            'region': locations['city_region'][city],
+            'tech_affinity': tech_affinity,
+            'isp': isp,
+            'timezone_offset': timezone_offset,
+            'language': language,
+            'user_type': user_type,
+            'num_sessions': num_sessions,
+            'behavior_pattern': behavior_pattern,
+            'device': device,
+            'browser': browser,
+            'version': version,
+            'operating_system': operating_system,
+            'screen': screen,
+            'viewport': viewport,
+            'ip_octets': (rng.integers(0, 256, num_users), rng.integers(1, 255, num_users))
+        }
+
+    def generate_batch_timestamps(self, start_time, timezone_offset, behavior_pattern, rng):
+        """Session start times (epoch microseconds) for arrays of time zones and behavior patterns"""
+        size = len(timezone_offset)
+        mean, std, low, high = self.user_table['hours'][behavior_pattern].T
+        hours = np.clip(rng.normal(mean, std), low, high).astype(np.int64)
+        day_bias = self.sampling_tables['days'].indexes(size, rng)
+        seconds = (
+            timezone_offset * 3600
+            + rng.integers(0, 31, size) * 86400
+            + hours * 3600
+            + rng.integers(0, 60, size) * 60
+            + rng.integers(0, 60, size)
+        )
+        start_us = (start_time - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        timestamps = start_us + seconds * 1_000_000
+
+        # Adjust for day of week bias: step a day at a time while the weekday
+        # is off and a 70% draw says to keep moving (1970-01-01 was a Thursday)
+        moving = np.arange(size)
+        while len(moving):
+            weekday = (timestamps[moving] // 86_400_000_000 + 3) % 7
+            moving = moving[(weekday != day_bias[moving]) & (rng.random(len(moving)) < 0.7)]
+            timestamps[moving] += np.where(rng.random(len(moving)) < 0.5, -1, 1) * 86_400_000_000
+        return timestamps
+
+    def generate_batch_journeys(self, entry_page, tech_affinity, user_type, rng):
+        """
+        Journeys of a batch of sessions, as arrays with one element per page view.
+
+        All sessions advance one step at a time: the current pages of the
+        sessions still going are recorded, then each draws its next page from
+        its row of the transition matrix. The per-view metrics are drawn
+        afterwards for every view at once.
+        """
+        pages = self.page_table
+        num_sessions = len(entry_page)
+        duration = rng.exponential(self.time_distributions['session_duration_mean'], num_sessions).astype(np.int64)
+        steps = rng.integers(1, np.minimum(MAX_JOURNEY_STEPS, np.maximum(1, duration)) + 1)
+
+        sessions, step_numbers, visited, bounces = [], [], [], []
+        active = np.arange(num_sessions)
+        current = np.asarray(entry_page)
+        for step in range(MAX_JOURNEY_STEPS):
+            if not len(active):
+                break
+            sessions.append(active)
+            step_numbers.append(np.full(len(active), step))
+            visited.append(current)
+            if step == 0:
+                bounce = rng.random(len(active)) < pages['bounce_probability'][current]
+            else:
+                bounce = np.zeros(len(active), dtype=bool)
+            bounces.append(bounce)
+
+            # Bounces, /contact and journeys at their length stop; the rest
+            # move on unless they draw 'exit'
+            going = ~bounce & (current != pages['contact']) & (step + 1 < steps[active])
+            active, current = active[going], current[going]
+            following = _draw_grouped(rng, pages['next_pages'], current)
+            staying = following < len(pages['pages'])
+            active, current = active[staying], following[staying]
+
+        session = np.concatenate(sessions)
+        page = np.concatenate(visited)
+        size = len(page)
+        affinity = tech_affinity[session]
+
+        time_on_page = np.maximum(10, rng.gamma(2, pages['avg_time_on_page'][page] / 2).astype(np.int64))
+
+        # Scroll depth based on time on page, adjusted for tech affinity
+        low = np.select([time_on_page < 30, time_on_page < 60], [20, 40], 60)
+        high = np.select([time_on_page < 30, time_on_page < 60], [50, 75], 100)
+        scroll_depth = np.minimum(100, rng.integers(low, high + 1) + np.trunc((affinity - 0.75) * 20).astype(np.int64))
+
+        clicks_count = _draw_grouped(rng, pages['clicks_by_kind'], pages['kind'][page])
+
+        # Page load time: 5% slow outliers, then 10% of the rest very fast
+        slow = rng.random(size) < 0.05
+        fast = rng.random(size) < 0.1
+        page_load_time = np.where(
+            slow, rng.integers(3000, 8001, size),
+            np.where(fast, rng.integers(200, 601, size), rng.integers(700, 2501, size))
+        )
+
+        base_engagement = (time_on_page / 60 + scroll_depth / 100 + clicks_count / 3 + affinity) / 4
+        engagement_score = np.clip(np.round(base_engagement * 10 + rng.uniform(-1, 1, size), 1), 1.0, 10.0)
+
+        conversion_prob = pages['conversion_probability'][page] * self.user_table['conversion_multiplier'][user_type[session]]
+        is_converted = rng.random(size) < conversion_prob
+        # Codes into [''] + conversion_types
+        conversion_type = np.where(is_converted, 1 + rng.integers(0, len(self.conversion_types), size), 0)
+
+        return {
+            'session': session,
+            'step': np.concatenate(step_numbers),
+            'page_visited': page,
+            'time_on_page_seconds': time_on_page,
+            'scroll_depth_percent': scroll_depth,
+            'clicks_count': clicks_count,
+            'page_load_time_ms': page_load_time,
+            'engagement_score': engagement_score,
+            'is_bounce': np.concatenate(bounces),
+            'is_converted': is_converted,
+            'conversion_type': conversion_type
+        }
+
+    def generate_weblog_columns(self, num_users=20, start_date=None, seed=None, first_user=1):
+        """
+        Generate weblogs in batch mode, as dictionary-encoded columns sorted by timestamp.
+
+        Profiles, sessions and page views are drawn as NumPy arrays from
+        `np.random.default_rng(seed)` with the tables compiled by
+        setup_batch_tables, following the same distributions as
+        generate_synthetic_weblogs. Returns {'columns': ..., 'dictionaries': ...}
+        where string fields hold int32 codes into their dictionary and
+        timestamps are epoch microseconds. Visitors are numbered from `first_user`.
+        """
+        if start_date is None:
+            start_date = datetime(2024, 3, 15, 0, 0, 0)
+        rng = np.random.default_rng(seed)
+        profiles = self.generate_batch_profiles(num_users, rng)
+
+        # Sessions, with their start time, attribution and entry page
+        session_user = np.repeat(np.arange(num_users), profiles['num_sessions'])
+        num_sessions = len(session_user)
+        session_start = self.generate_batch_timestamps(
+            start_date,
+            profiles['timezone_offset'][session_user],
+            profiles['behavior_pattern'][session_user],
+            rng
+        )
+        marketing = self.marketing_table
+        source = self.sampling_tables['utm_sources'].indexes(num_sessions, rng)
+        medium = _choose_within(rng, *marketing['mediums'][1:], source)
+        campaign = _choose_within(rng, *marketing['campaigns'][1:], source)
+        referrer = self.sampling_tables['referrers'].indexes(num_sessions, rng)
+        entry_pages, entry_offsets, entry_counts = marketing['entry_pages']
+        entry_page = np.array(entry_pages)[_choose_within(rng, entry_offsets, entry_counts, source)]
+        session_ids = [f"sess_{value:016x}" for value in np.frombuffer(rng.bytes(8 * num_sessions), dtype=np.uint64).tolist()]
+
+        journeys = self.generate_batch_journeys(
+            entry_page,
+            profiles['tech_affinity'][session_user],
+            profiles['user_type'][session_user],
+            rng
+        )
+        session, step = journeys['session'], journeys['step']
+        user = session_user[session]
+        timestamp = session_start[session] + (step * 120 + rng.integers(0, 121, len(step))) * 1_000_000
+
+        # Per-user strings, built once per user or distinct combination
+        locations, devices = self.location_table, self.device_table
+        third_octet, fourth_octet = profiles['ip_octets']
+        ip_addresses = [
+            f"{locations['ip_bases'][country]}.{third}.{fourth}"
+            for country, third, fourth in zip(profiles['country'].tolist(), third_octet.tolist(), fourth_octet.tolist())
+        ]
+        versions = devices['versions'][0]
+        combinations, user_combination = np.unique(
+            np.stack([profiles['browser'], profiles['version'], profiles['operating_system']], axis=1),
+            axis=0, return_inverse=True
+        )
+        user_agents = [
+            self.generate_user_agent(
+                devices['browsers'][browser][0], devices['browsers'][browser][1],
+                versions[version], devices['operating_systems'][operating_system]
+            )
+            for browser, version, operating_system in combinations.tolist()
+        ]
+        browser_of_version = np.repeat(np.arange(len(devices['browsers'])), devices['versions'][2])
+        browser_names = [f"{devices['browsers'][b][1]} {v}" for b, v in zip(browser_of_version.tolist(), versions)]
+
+        strings = {
+            'visitor_id': ([f"visitor_{i:03d}" for i in range(first_user, first_user + num_users)], user),
+            'session_id': (session_ids, session),
+            'page_visited': (self.page_table['pages'], journeys['page_visited']),
+            'page_title': (self.page_table['titles'], journeys['page_visited']),
+            'ip_address': (ip_addresses, user),
+            'user_agent': (user_agents, user_combination.reshape(-1)[user]),
+            'referrer': (marketing['referrers'], referrer[session]),
+            'language': (locations['languages'][0], profiles['language'][user]),
+            'screen_resolution': (devices['screens'][0], profiles['screen'][user]),
+            'viewport_size': (devices['viewports'][0], profiles['viewport'][user]),
+            'device_type': (devices['devices'], profiles['device'][user]),
+            'operating_system': (devices['operating_systems'], profiles['operating_system'][user]),
+            'browser': (browser_names, profiles['version'][user]),
+            'country': (locations['countries'], profiles['country'][user]),
+            'region': (locations['regions'], profiles['region'][user]),
+            'city': (locations['cities'], profiles['city'][user]),
+            'isp': (locations['isps'][0], profiles['isp'][user]),
+            'utm_source': (marketing['sources'], source[session]),
+            'utm_medium': (marketing['mediums'][0], medium[session]),
+            'utm_campaign': (marketing['campaigns'][0], campaign[session]),
+            'conversion_type': ([''] + self.conversion_types, journeys['conversion_type'])
+        }
+
+        # Sort by timestamp; ties keep the per-row order (visitor, session, step)
+        order = np.lexsort((step, session, timestamp))
+        columns, dictionaries = {}, {}
+        for name in WEBLOG_FIELDS:
+            if name == 'timestamp':
+                columns[name] = timestamp[order]
+            elif name in strings:
+                table, codes = strings[name]
+                dictionaries[name], codes = _encode(table, codes)
+                columns[name] = codes[order]
+            else:
+                columns[name] = journeys[name][order]
+        return {'columns': columns, 'dictionaries': dictionaries}
+
+    def columns_to_weblogs(self, batch):
+        """Weblog entries, as built by generate_synthetic_weblogs, from batch columns"""
+        columns, dictionaries = batch['columns'], batch['dictionaries']
+        values = []
+        for name in WEBLOG_FIELDS:
+            column = columns[name]
+            if name == 'timestamp':
+                stamps = np.datetime_as_string(column.astype('datetime64[us]'), unit='ms').tolist()
+                values.append([stamp + 'Z' for stamp in stamps])
+            elif name in dictionaries:
+                values.append(np.array(dictionaries[name], dtype=object)[column].tolist())
+            else:
+                values.append(column.tolist())
+        return [dict(zip(WEBLOG_FIELDS, row)) for row in zip(*values)]
+
+    def generate_synthetic_weblogs_batch(self, num_users=20, start_date=None, seed=None):
+        """Batch-mode equivalent of generate_synthetic_weblogs, drawing every value as NumPy arrays"""
+        print(f"Generating {num_users} users in batch mode...")
+        weblogs = self.columns_to_weblogs(self.generate_weblog_columns(num_users, start_date, seed))
+
+        print(f"Generated {len(weblogs)} weblog entries across {num_users} users")
+        print(f"Average {len(weblogs)/num_users:.1f} page views per user")
+
+        self.print_summary_stats(weblogs)
+
+        return {"weblogs": weblogs}
+
     def print_summary_stats(self, weblogs):
         """Print summary statistics about the generated data"""
         print("\n--- DATA SUMMARY ---")
@@ -946,10 +1576,293 @@ class WeblogGenerator:
             print(f"  {page}: {count} views")
 
 
+def _line_timestamp(line):
+    """Sort key of a serialized entry: its timestamp, which is always the first field"""
+    return line[:line.index('",')]
+
+
+def _write_run(lines, directory, number):
+    path = os.path.join(directory, f'run-{number:06d}.ndjson')
+    with open(path, 'w') as f:
+        f.writelines(lines)
+    return path
+
+
+def _merge_runs(paths):
+    """Yield the lines of sorted run files in merged timestamp order; ties keep run order"""
+    files = [open(path) for path in paths]
+    try:
+        yield from heapq.merge(*files, key=_line_timestamp)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _merge_all(runs, directory):
+    """Merge sorted runs in passes of MERGE_FAN_IN, then yield the lines of the final merge"""
+    number = len(runs)
+    while len(runs) > MERGE_FAN_IN:
+        merged = []
+        for start in range(0, len(runs), MERGE_FAN_IN):
+            group = runs[start:start + MERGE_FAN_IN]
+            merged.append(_write_run(_merge_runs(group), directory, number))
+            number += 1
+            for path in group:
+                os.remove(path)
+        runs = merged
+    yield from _merge_runs(runs)
+
+
+def sort_weblogs_external(entries, run_size=RUN_SIZE, temp_dir=None):
+    """
+    Yield weblog entries as NDJSON lines sorted by timestamp, in bounded memory.
+
+    Entries are serialized and sorted in runs of `run_size`, which are
+    spilled to temporary files and k-way merged (in several passes when there
+    are more than MERGE_FAN_IN runs). Ties keep the input order, as with
+    list.sort, so the result matches sorting everything in memory.
+    """
+    entries = iter(entries)
+    with tempfile.TemporaryDirectory(prefix='weblog-runs-', dir=temp_dir) as directory:
+        runs = []
+        while True:
+            lines = [json.dumps(entry) + '\n' for entry in itertools.islice(entries, run_size)]
+            if not lines:
+                break
+            lines.sort(key=_line_timestamp)
+            if not runs and len(lines) < run_size:
+                # Everything fit in one run
+                yield from lines
+                return
+            runs.append(_write_run(lines, directory, len(runs)))
+            del lines
+        yield from _merge_all(runs, directory)
+
+
+def _seeded_block(generator, seed, block, block_users, num_users, start_date):
+    """Batch columns of block `block` of users (cut short at `num_users`), from the block's own seed"""
+    first = block * block_users
+    return generator.generate_weblog_columns(
+        min(block_users, num_users - first),
+        start_date,
+        seed=np.random.SeedSequence(seed, spawn_key=(block,)),
+        first_user=first + 1
+    )
+
+
+def _generate_block(task):
+    """Worker: generate one block of users in batch mode and write it as a time-sorted run"""
+    seed, block, block_users, num_users, start_date, directory = task
+    generator = WeblogGenerator()
+    batch = _seeded_block(generator, seed, block, block_users, num_users, start_date)
+    lines = [json.dumps(entry) + '\n' for entry in generator.columns_to_weblogs(batch)]
+    return _write_run(lines, directory, block), len(lines)
+
+
+def generate_weblogs_parallel(output_file, num_users, seed=0, workers=None, start_date=None,
+                              output_format='ndjson', temp_dir=None, block_users=BLOCK_USERS):
+    """
+    Generate weblogs for `num_users` users on several processes and write them time-sorted.
+
+    Users are split into blocks of `block_users`; block b is generated in
+    batch mode from its own np.random.Generator seeded with
+    SeedSequence(seed, spawn_key=(b,)), and written by a worker as a sorted
+    run. The runs are k-way merged in block order, so the same seed gives
+    byte-identical output whatever the number of workers. Returns the number
+    of entries written.
+    """
+    with tempfile.TemporaryDirectory(prefix='weblog-runs-', dir=temp_dir) as directory:
+        tasks = [
+            (seed, block, block_users, num_users, start_date, directory)
+            for block in range(math.ceil(num_users / block_users))
+        ]
+        if workers == 1:
+            results = list(map(_generate_block, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_generate_block, tasks))
+        return write_weblogs(_merge_all([path for path, _ in results], directory), output_file, output_format)
+
+
+def _generate_corpus_block(task):
+    """Worker: batch columns of one full block of users"""
+    seed, block, block_users, start_date = task
+    return _seeded_block(WeblogGenerator(), seed, block, block_users, (block + 1) * block_users, start_date)
+
+
+def _trim_block(batch, rows):
+    """The first `rows` rows of a block by visitor: whole visitors, then the earliest views of the next one"""
+    visitor = batch['columns']['visitor_id']
+    counts = np.bincount(visitor)
+    whole = int(np.searchsorted(np.cumsum(counts), rows, side='right'))
+    keep = visitor < whole
+    keep[np.flatnonzero(visitor == whole)[:rows - int(counts[:whole].sum())]] = True
+    return {
+        'columns': {name: column[keep] for name, column in batch['columns'].items()},
+        'dictionaries': batch['dictionaries']
+    }
+
+
+def _merge_dictionaries(blocks, name):
+    """Recode one string column of every block into a shared dictionary of the values in use"""
+    values, codes = [], {}
+    for batch in blocks:
+        column, table = batch['columns'][name], batch['dictionaries'][name]
+        used = np.zeros(len(table), dtype=bool)
+        used[column] = True
+        remap = np.zeros(len(table), dtype=np.int32)
+        for code in np.flatnonzero(used).tolist():
+            value = table[code]
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+            remap[code] = codes[value]
+        batch['columns'][name] = remap[column]
+    return values
+
+
+def build_corpus(path, rows, seed=CORPUS_SEED, workers=None, start_date=None,
+                 block_users=BLOCK_USERS, metadata=None):
+    """
+    Write a corpus of exactly `rows` weblog entries as a snapshot directory at `path`.
+
+    Full blocks of users are generated in batch mode from their own seeds,
+    in waves across worker processes, until they cover `rows`; the last
+    block is cut to size. Rows are sorted by timestamp and written one column
+    at a time in the WeblogStore snapshot format (a `.npy` file per column
+    and a small manifest), so WeblogStore.load(..., mmap=True) maps the
+    corpus without parsing any JSON. Returns the manifest metadata.
+    """
+    workers = workers or os.cpu_count() or 1
+    blocks, total, block = [], 0, 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while total < rows:
+            wave = min(workers, max(1, math.ceil((rows - total) / (block_users * EXPECTED_ROWS_PER_USER))))
+            tasks = [(seed, b, block_users, start_date) for b in range(block, block + wave)]
+            block += wave
+            for batch in (pool.map(_generate_corpus_block, tasks) if pool else map(_generate_corpus_block, tasks)):
+                size = len(batch['columns']['timestamp'])
+                if total + size > rows:
+                    batch, size = _trim_block(batch, rows - total), rows - total
+                if size:
+                    blocks.append(batch)
+                    total += size
+    finally:
+        if pool:
+            pool.shutdown()
+
+    kinds = {}
+    for name in WEBLOG_FIELDS:
+        if name == 'timestamp':
+            kinds[name] = 'timestamp'
+        elif name in blocks[0]['dictionaries']:
+            kinds[name] = 'string'
+        else:
+            kinds[name] = {'b': 'bool', 'i': 'int', 'f': 'float'}[blocks[0]['columns'][name].dtype.kind]
+    dictionaries = {name: _merge_dictionaries(blocks, name) for name, kind in kinds.items() if kind == 'string'}
+    order = np.argsort(np.concatenate([batch['columns']['timestamp'] for batch in blocks]), kind='stable')
+
+    def sorted_columns():
+        # One column in memory at a time, dropping the block pieces as they are used
+        for name in WEBLOG_FIELDS:
+            yield name, np.concatenate([batch['columns'].pop(name) for batch in blocks])[order]
+
+    metadata = dict(metadata or {})
+    metadata.update({
+        'generator': 'generate_weblogs.py',
+        'seed': seed,
+        'block_users': block_users,
+        'start_date': (start_date or datetime(2024, 3, 15, 0, 0, 0)).isoformat(),
+        'visitors': len(dictionaries['visitor_id'])
+    })
+    write_snapshot(path, kinds, sorted_columns(), dictionaries, metadata)
+    return metadata
+
+
+def write_weblogs(lines, output_file, output_format='ndjson'):
+    """
+    Write serialized entries to `output_file` as they arrive, either as NDJSON
+    or as a {"weblogs": [...]} JSON document with one entry per line.
+    Returns the number of entries written.
+    """
+    count = 0
+    with open(output_file, 'w') as f:
+        if output_format == 'json':
+            f.write('{"weblogs": [\n')
+        for line in lines:
+            if output_format == 'json':
+                f.write(',\n' + line[:-1] if count else line[:-1])
+            else:
+                f.write(line)
+            count += 1
+        if output_format == 'json':
+            f.write('\n]}\n')
+    return count
+
+
 def main():
     """Main function to generate synthetic weblog data"""
+    parser = argparse.ArgumentParser(description='Generate synthetic visitor weblogs')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream time-sorted entries to --output in bounded memory')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='generate on this many processes from --seed (deterministic for any worker count)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help=f'random seed (with --workers, default 0; for corpus, default {CORPUS_SEED})')
+    parser.add_argument('--users', type=int, default=50, help='number of visitors to generate (with --stream or --workers)')
+    parser.add_argument('--output', default='synthetic_visitor_weblogs.ndjson', help='output file (with --stream or --workers)')
+    parser.add_argument('--format', dest='output_format', choices=['ndjson', 'json'], default='ndjson',
+                        help='streamed output format')
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE, help='entries held in memory per sorted run')
+    parser.add_argument('--temp-dir', default=None, help='directory for sorted runs (default: system temp)')
+    subparsers = parser.add_subparsers(dest='command')
+    corpus_parser = subparsers.add_parser(
+        'corpus', help='write benchmark corpora at preset scales as memory-mappable snapshots'
+    )
+    corpus_parser.add_argument('--scale', action='append', choices=list(CORPUS_SCALES),
+                               help='preset size in rows; repeat for several (default: 100k)')
+    # SUPPRESS keeps the subcommand from overwriting --seed/--workers given
+    # before it with its own defaults
+    corpus_parser.add_argument('--seed', type=int, default=argparse.SUPPRESS,
+                               help=f'random seed (default {CORPUS_SEED})')
+    corpus_parser.add_argument('--workers', type=int, default=argparse.SUPPRESS,
+                               help='worker processes (default: one per CPU)')
+    corpus_parser.add_argument('--output-dir', default='corpora', help='directory receiving weblogs-<scale>/')
+    args = parser.parse_args()
+    
+    if args.command == 'corpus':
+        seed = CORPUS_SEED if args.seed is None else args.seed
+        for scale in args.scale or ['100k']:
+            path = os.path.join(args.output_dir, f'weblogs-{scale}')
+            print(f"Building {scale} corpus in {path}...")
+            metadata = build_corpus(
+                path, CORPUS_SCALES[scale], seed=seed, workers=args.workers,
+                metadata={'scale': scale}
+            )
+            print(f"Wrote {CORPUS_SCALES[scale]} rows from {metadata['visitors']} visitors to {path}")
+        return
+    
+    if args.workers is not None:
+        seed = 0 if args.seed is None else args.seed
+        print(f"Generating weblogs for {args.users} users on {args.workers} workers (seed {seed})...")
+        count = generate_weblogs_parallel(
+            args.output, args.users, seed=seed, workers=args.workers,
+            output_format=args.output_format, temp_dir=args.temp_dir
+        )
+        print(f"Wrote {count} weblog entries to {args.output}")
+        return
+    
     generator = WeblogGenerator()
     
+    if args.stream:
+        print(f"Streaming weblogs for {args.users} users to {args.output}...")
+        entries = generator.iter_synthetic_weblogs(num_users=args.users)
+        lines = sort_weblogs_external(entries, run_size=args.run_size, temp_dir=args.temp_dir)
+        count = write_weblogs(lines, args.output, args.output_format)
+        print(f"Wrote {count} weblog entries to {args.output}")
+        return
+    
     # Generate data with more users and better distribution
     synthetic_data = generator.generate_synthetic_weblogs(
         num_users=50,  # Increased for better patterns
@@ -0,0 +1,195 @@
+"""Per-location aggregates for the Regional Reports heatmap.
+
+Every (city, country) pair in the log gets a slot holding the three heatmap
+metrics, kept current on every insert:
+
+- engagement: page views and the sum of engagement scores
+- time: the average time on page of each session seen at the location,
+  summed per location together with the number of sessions, so the mean of
+  the per-session averages is one division away
+- traffic: page views per page visited
+
+Coordinates come from the table below, which covers every city the weblog
+generator produces; unknown locations are reported without coordinates.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from weblog_store import grow
+
+# (latitude, longitude) by (city, country)
+COORDINATES: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ('Los Angeles', 'United States'): (34.0522, -118.2437),
+    ('San Francisco', 'United States'): (37.7749, -122.4194),
+    ('San Diego', 'United States'): (32.7157, -117.1611),
+    ('Sacramento', 'United States'): (38.5816, -121.4944),
+    ('New York', 'United States'): (40.7128, -74.0060),
+    ('Buffalo', 'United States'): (42.8864, -78.8784),
+    ('Albany', 'United States'): (42.6526, -73.7562),
+    ('Houston', 'United States'): (29.7604, -95.3698),
+    ('Austin', 'United States'): (30.2672, -97.7431),
+    ('Dallas', 'United States'): (32.7767, -96.7970),
+    ('Seattle', 'United States'): (47.6062, -122.3321),
+    ('Spokane', 'United States'): (47.6588, -117.4260),
+    ('London', 'United Kingdom'): (51.5074, -0.1278),
+    ('Manchester', 'United Kingdom'): (53.4808, -2.2426),
+    ('Birmingham', 'United Kingdom'): (52.4862, -1.8904),
+    ('Leeds', 'United Kingdom'): (53.8008, -1.5491),
+    ('Edinburgh', 'United Kingdom'): (55.9533, -3.1883),
+    ('Glasgow', 'United Kingdom'): (55.8642, -4.2518),
+    ('Cardiff', 'United Kingdom'): (51.4816, -3.1791),
+    ('Munich', 'Germany'): (48.1351, 11.5820),
+    ('Nuremberg', 'Germany'): (49.4521, 11.0767),
+    ('Cologne', 'Germany'): (50.9375, 6.9603),
+    ('Düsseldorf', 'Germany'): (51.2277, 6.7735),
+    ('Dortmund', 'Germany'): (51.5136, 7.4653),
+    ('Berlin', 'Germany'): (52.5200, 13.4050),
+    ('Toronto', 'Canada'): (43.6532, -79.3832),
+    ('Ottawa', 'Canada'): (45.4215, -75.6972),
+    ('Vancouver', 'Canada'): (49.2827, -123.1207),
+    ('Victoria', 'Canada'): (48.4284, -123.3656),
+    ('Montreal', 'Canada'): (45.5017, -73.5673),
+    ('Quebec City', 'Canada'): (46.8139, -71.2080),
+    ('Sydney', 'Australia'): (-33.8688, 151.2093),
+    ('Newcastle', 'Australia'): (-32.9283, 151.7817),
+    ('Melbourne', 'Australia'): (-37.8136, 144.9631),
+    ('Geelong', 'Australia'): (-38.1499, 144.3617),
+    ('Brisbane', 'Australia'): (-27.4698, 153.0251),
+    ('Gold Coast', 'Australia'): (-28.0167, 153.4000),
+    ('Paris', 'France'): (48.8566, 2.3522),
+    ('Marseille', 'France'): (43.2965, 5.3698),
+    ('Nice', 'France'): (43.7102, 7.2620),
+    ('Lyon', 'France'): (45.7640, 4.8357),
+    ('Madrid', 'Spain'): (40.4168, -3.7038),
+    ('Barcelona', 'Spain'): (41.3874, 2.1686),
+    ('Girona', 'Spain'): (41.9794, 2.8214),
+    ('Seville', 'Spain'): (37.3891, -5.9845),
+    ('Málaga', 'Spain'): (36.7213, -4.4214),
+}
+
+
+def _grow_columns(array: np.ndarray, size: int) -> np.ndarray:
+    """`array` with at least `size` columns, new columns zero-filled"""
+    if array.shape[1] >= size:
+        return array
+    grown = np.zeros((array.shape[0], max(size, 2 * array.shape[1])), dtype=array.dtype)
+    grown[:, :array.shape[1]] = array
+    return grown
+
+
+class GeoAggregates:
+    """Heatmap metrics per (city, country), updated incrementally from a WeblogStore"""
+
+    def __init__(self, store):
+        self.store = store
+        self.locations: List[Tuple[int, int]] = []
+        self._location_of: Dict[Tuple[int, int], int] = {}
+        self.page_views = np.zeros(0, dtype=np.int64)
+        self.engagement_sum = np.zeros(0, dtype=np.float64)
+        self.session_count = np.zeros(0, dtype=np.int64)
+        # Sum over the location's sessions of each session's average time on page
+        self.session_average_sum = np.zeros(0, dtype=np.float64)
+        self.page_traffic = np.zeros((0, 0), dtype=np.int64)
+
+        # One slot per (location, session) pair
+        self._pair_of: Dict[int, int] = {}
+        self._pair_location = np.zeros(0, dtype=np.int64)
+        self._pair_time = np.zeros(0, dtype=np.int64)
+        self._pair_views = np.zeros(0, dtype=np.int64)
+
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _location_codes(self, city: np.ndarray, country: np.ndarray) -> np.ndarray:
+        """Location index per row, registering locations seen for the first time"""
+        keys = (country.astype(np.int64) << 32) | city.astype(np.int64)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        slots = np.empty(len(unique), dtype=np.int64)
+        for i, key in enumerate(unique.tolist()):
+            location = (key & 0xFFFFFFFF, key >> 32)
+            slot = self._location_of.get(location)
+            if slot is None:
+                slot = self._location_of[location] = len(self.locations)
+                self.locations.append(location)
+            slots[i] = slot
+        return slots[inverse.reshape(-1)]
+
+    def _pair_codes(self, locations: np.ndarray, sessions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Unique (location, session) pair slots in a batch, and each row's index into them"""
+        keys = (locations << 32) | sessions.astype(np.int64)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        slots = np.empty(len(unique), dtype=np.int64)
+        for i, key in enumerate(unique.tolist()):
+            slot = self._pair_of.get(key)
+            if slot is None:
+                slot = self._pair_of[key] = len(self._pair_of)
+            slots[i] = slot
+        size = len(self._pair_of)
+        self._pair_location = grow(self._pair_location, size)
+        self._pair_time = grow(self._pair_time, size)
+        self._pair_views = grow(self._pair_views, size)
+        self._pair_location[slots] = unique >> 32
+        return slots, inverse.reshape(-1)
+
+    def update(self, rows: range):
+        """Fold a batch of newly appended rows into the location metrics"""
+        if not len(rows):
+            return
+        store = self.store
+        rows = slice(rows.start, rows.stop)
+        locations = self._location_codes(store.column('city')[rows], store.column('country')[rows])
+        n = len(self)
+        self.page_views = grow(self.page_views, n)
+        self.engagement_sum = grow(self.engagement_sum, n)
+        self.session_count = grow(self.session_count, n)
+        self.session_average_sum = grow(self.session_average_sum, n)
+        self.page_traffic = _grow_columns(grow(self.page_traffic, n), len(store.dictionary('page_visited')))
+
+        np.add.at(self.page_views, locations, 1)
+        np.add.at(self.engagement_sum, locations, store.column('engagement_score')[rows])
+        np.add.at(self.page_traffic, (locations, store.column('page_visited')[rows]), 1)
+
+        # Replace each touched session's old average with its new one
+        pairs, index = self._pair_codes(locations, store.column('session_id')[rows])
+        views = self._pair_views[pairs]
+        times = self._pair_time[pairs]
+        old_average = np.where(views > 0, times / np.maximum(views, 1), 0.0)
+        np.add.at(times, index, store.column('time_on_page_seconds')[rows])
+        np.add.at(views, index, 1)
+        pair_locations = self._pair_location[pairs]
+        np.add.at(self.session_average_sum, pair_locations, times / views - old_average)
+        np.add.at(self.session_count, pair_locations, self._pair_views[pairs] == 0)
+        self._pair_time[pairs] = times
+        self._pair_views[pairs] = views
+
+    def locations_summary(self) -> List[Dict[str, Any]]:
+        """One entry per location with its coordinates and all three heatmap metrics"""
+        store = self.store
+        cities = store.dictionary('city')
+        countries = store.dictionary('country')
+        pages = store.dictionary('page_visited')
+        summaries = []
+        for slot, (city_code, country_code) in enumerate(self.locations):
+            city, country = cities[city_code], countries[country_code]
+            coordinates: Optional[Tuple[float, float]] = COORDINATES.get((city, country))
+            page_views = int(self.page_views[slot])
+            sessions = int(self.session_count[slot])
+            traffic = self.page_traffic[slot, :len(pages)]
+            summaries.append({
+                'city': city,
+                'country': country,
+                'latitude': coordinates[0] if coordinates else None,
+                'longitude': coordinates[1] if coordinates else None,
+                'page_views': page_views,
+                'sessions': sessions,
+                'avg_engagement': float(self.engagement_sum[slot]) / page_views,
+                'avg_session_time': float(self.session_average_sum[slot]) / sessions,
+                'page_traffic': {pages[code]: int(traffic[code]) for code in np.flatnonzero(traffic).tolist()},
+            })
+        summaries.sort(key=lambda summary: -summary['page_views'])
+        return summaries
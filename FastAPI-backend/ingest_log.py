@@ -0,0 +1,379 @@
+"""Durable append-only log of ingested weblog rows.
+
+Rows are written as NDJSON records to numbered segment files in a log
+directory. Concurrent writers are grouped: every record queued while a
+flush is pending goes out in the same write and the same fsync, so the
+per-request cost of durability is shared by the whole group.
+
+Once a segment passes `segment_bytes` it is sealed and a new one is
+started. When enough sealed segments pile up they are compacted into a
+checkpoint (a WeblogStore snapshot) in a background thread and deleted,
+so replay on startup is bounded by the checkpoint plus a few segments.
+
+With `shared=True` several processes (e.g. uvicorn workers) use one log
+directory as their common store. Appends, compaction and checkpoint reads
+are serialized with an flock on a lock file, and each process tails the
+log with `catch_up`, appending rows written by any process to its own store
+in log order, so every worker ends up with the same rows in the same order.
+A process that falls behind a compaction takes the rows it missed from the
+checkpoint, which holds them in the same order.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import os
+import re
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from weblog_store import WeblogStore, read_manifest, recover_snapshot
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.ndjson$')
+CHECKPOINT_DIR = 'checkpoint'
+LOCK_FILE = 'lock'
+COMPACTION_LOCK_FILE = 'compaction.lock'
+LOG_ID_FILE = 'log-id'
+
+
+def _segment_name(number: int) -> str:
+    return f"segment-{number:08d}.ndjson"
+
+
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class IngestLog:
+    """Segmented NDJSON write-ahead log with group commit and compaction"""
+
+    def __init__(
+        self,
+        directory: str,
+        model,
+        segment_bytes: int = 64 * 1024 * 1024,
+        compact_after: int = 4,
+        commit_delay: float = 0.002,
+        shared: bool = False,
+    ):
+        self.directory = directory
+        self.model = model
+        self.segment_bytes = segment_bytes
+        self.compact_after = compact_after
+        self.commit_delay = commit_delay
+        self.shared = shared
+
+        os.makedirs(directory, exist_ok=True)
+        self._pending: List[tuple] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._compactor: Optional[threading.Thread] = None
+        self._file = None
+        # Held by every write, so close() cannot close the file under one
+        self._write_lock = threading.Lock()
+        self._closed = False
+        # A compaction may have crashed while swapping the checkpoint in
+        with self._locked():
+            recover_snapshot(os.path.join(directory, CHECKPOINT_DIR))
+        # Never reuse a number already folded into the checkpoint
+        self._segment = max(self.segments() + [self._checkpoint_through()])
+        # Read position of replay/catch_up: segment, byte offset in it, and
+        # rows taken from the log so far (checkpoint included)
+        self._position: Tuple[int, int] = (0, 0)
+        self._consumed = 0
+        self._catch_up_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Locking
+    # ------------------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _locked(self, name: str = LOCK_FILE, exclusive: bool = True, blocking: bool = True):
+        """
+        Hold an flock on a file in the log directory while shared; yields
+        whether the lock was taken (always True when blocking or not shared).
+        """
+        if not self.shared:
+            yield True
+            return
+        fd = os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    @property
+    def log_id(self) -> str:
+        """Random id of this log directory, created on first use and shared by every process"""
+        path = os.path.join(self.directory, LOG_ID_FILE)
+        with self._locked():
+            if not os.path.exists(path):
+                with open(path, 'w') as f:
+                    f.write(uuid.uuid4().hex[:8])
+            with open(path) as f:
+                return f.read().strip()
+
+    # ------------------------------------------------------------------
+    # Segments and checkpoint
+    # ------------------------------------------------------------------
+
+    def segments(self) -> List[int]:
+        """Numbers of the segment files on disk, in order"""
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, _segment_name(number))
+
+    def _checkpoint_through(self) -> int:
+        """Last segment folded into the checkpoint (0 if there is none)"""
+        manifest = read_manifest(os.path.join(self.directory, CHECKPOINT_DIR))
+        return manifest['metadata'].get('segments_through', 0) if manifest else 0
+
+    def _read_segment(self, number: int, start: int = 0, repair: bool = False) -> Tuple[List[Any], int]:
+        """
+        Parse one segment from byte `start` on, returning the records and the
+        offset just past the last complete one. A torn final record (crash or
+        a write still in progress) is left unread, and with `repair` the file
+        is truncated back to the last complete record.
+        """
+        path = self._segment_path(number)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if repair and end < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(start + end)
+                os.fsync(f.fileno())
+        records = [self.model.model_validate_json(line) for line in data[:end].splitlines() if line.strip()]
+        return records, start + end
+
+    # ------------------------------------------------------------------
+    # Startup and tailing
+    # ------------------------------------------------------------------
+
+    def replay(self, store: WeblogStore) -> int:
+        """Append the checkpoint and every newer segment to `store`; returns rows replayed"""
+        before = len(store)
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_DIR)
+        # Exclusive while shared: repair must not truncate another process's write
+        with self._locked():
+            through = self._checkpoint_through()
+            self._position = (through + 1, 0)
+            if through:
+                rows = store.extend_from(WeblogStore.load(self.model, checkpoint_path))
+                self._consumed += len(rows)
+            for number in self.segments():
+                if number > through:
+                    records, end = self._read_segment(number, repair=True)
+                    store.extend(records)
+                    self._consumed += len(records)
+                    self._position = (number, end)
+        return len(store) - before
+
+    def catch_up(self, store: WeblogStore) -> int:
+        """
+        Append rows that reached the log since the last replay/catch_up (from
+        any process) to `store`; returns the number of rows appended. Costs a
+        stat call or two when nothing is new.
+        """
+        with self._catch_up_lock:
+            before = len(store)
+            while True:
+                segment, offset = self._position
+                try:
+                    size = os.path.getsize(self._segment_path(segment))
+                except FileNotFoundError:
+                    # Either not written yet, or sealed and compacted away
+                    # (the active segment is never compacted, so a newer one exists)
+                    later = [number for number in self.segments() if number > segment]
+                    if not later:
+                        break
+                    if not self._catch_up_checkpoint(store, segment):
+                        self._position = (later[0], 0)
+                    continue
+                if size > offset:
+                    try:
+                        records, end = self._read_segment(segment, offset)
+                    except FileNotFoundError:
+                        continue
+                    store.extend(records)
+                    self._consumed += len(records)
+                    self._position = (segment, end)
+                    if end < size:
+                        # A write still in progress; pick it up next time
+                        break
+                elif os.path.exists(self._segment_path(segment + 1)):
+                    self._position = (segment + 1, 0)
+                else:
+                    break
+            return len(store) - before
+
+    def _catch_up_checkpoint(self, store: WeblogStore, segment: int) -> bool:
+        """
+        If `segment` has been folded into the checkpoint, take the rows this
+        process has not seen yet from the checkpoint and move past it.
+        """
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_DIR)
+        with self._locked(exclusive=False):
+            through = self._checkpoint_through()
+            if segment > through:
+                return False
+            checkpoint = WeblogStore.load(self.model, checkpoint_path, mmap=True)
+            rows = store.extend_from(checkpoint, first=self._consumed)
+        self._consumed += len(rows)
+        self._position = (through + 1, 0)
+        return True
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        path = self._segment_path(self._segment)
+        if self._segment <= self._checkpoint_through() or (
+            os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes
+        ):
+            self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        _fsync_directory(self.directory)
+
+    def _write(self, data: bytes):
+        """Append one group of records and fsync it (runs in a worker thread)"""
+        with self._write_lock, self._locked():
+            if self._closed:
+                raise ValueError("ingest log is closed")
+            if self.shared:
+                # Another process may have started a newer segment
+                latest = max(self.segments() + [self._checkpoint_through()])
+                if latest != self._segment:
+                    self._segment = latest
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._open_segment()
+                self._maybe_compact()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    async def append(self, records: Sequence[bytes]):
+        """Queue NDJSON records and return once they are durable on disk"""
+        if not records:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((records, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._flush_pending())
+        await future
+
+    async def _flush_pending(self):
+        loop = asyncio.get_running_loop()
+        group: List[tuple] = []
+        try:
+            while self._pending:
+                # Let concurrent writers join this group before it is written
+                await asyncio.sleep(self.commit_delay)
+                group, self._pending = self._pending, []
+                data = b"".join(record for records, _ in group for record in records)
+                try:
+                    await loop.run_in_executor(None, self._write, data)
+                except Exception as error:
+                    for _, future in group:
+                        if not future.done():
+                            future.set_exception(error)
+                else:
+                    for _, future in group:
+                        if not future.done():
+                            future.set_result(None)
+                group = []
+        finally:
+            # Cancelled (by close): nobody may be left waiting on a flush
+            # that will not happen
+            for _, future in group + self._pending:
+                if not future.done():
+                    future.cancel()
+
+    async def aclose(self):
+        """Wait for queued records to be flushed, then close the log"""
+        while self._flusher is not None and not self._flusher.done():
+            await asyncio.wait([self._flusher])
+        self.close()
+
+    def close(self):
+        """
+        Close the log. A write in progress finishes first; a flush still
+        waiting to start is cancelled, along with the appends queued for it.
+        """
+        with self._write_lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        if self._compactor is not None:
+            self._compactor.join()
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _maybe_compact(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        through = self._checkpoint_through()
+        sealed = [number for number in self.segments() if through < number < self._segment]
+        if len(sealed) >= self.compact_after:
+            self._compactor = threading.Thread(target=self.compact, args=(sealed[-1],), daemon=True)
+            self._compactor.start()
+
+    def compact(self, through: int):
+        """Fold the checkpoint and all segments up to `through` into a new checkpoint"""
+        with self._locked(COMPACTION_LOCK_FILE, blocking=False) as acquired:
+            # While shared, only one process compacts at a time
+            if acquired:
+                self._compact(through)
+
+    def _compact(self, through: int):
+        checkpoint_path = os.path.join(self.directory, CHECKPOINT_DIR)
+        previous = self._checkpoint_through()
+        if through <= previous:
+            return
+        store = WeblogStore(self.model)
+        if previous:
+            store.extend_from(WeblogStore.load(self.model, checkpoint_path))
+        for number in self.segments():
+            if previous < number <= through:
+                store.extend(self._read_segment(number)[0])
+
+        metadata: Dict[str, Any] = {'segments_through': through}
+        # Sealed segments are immutable, so only replacing the checkpoint and
+        # deleting them has to exclude readers
+        with self._locked():
+            # save() fsyncs the checkpoint and swaps it in atomically, so the
+            # segments it now holds can go
+            store.save(checkpoint_path, metadata)
+            for number in self.segments():
+                if number <= through:
+                    os.remove(self._segment_path(number))
+            _fsync_directory(self.directory)
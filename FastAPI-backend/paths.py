@@ -0,0 +1,265 @@
+"""Page-to-page transitions, common paths and funnels over sessions.
+
+All three are computed from the rows of a SessionTable put in session order
+(by session, then timestamp, then row), with pages as dictionary codes:
+
+- transitions: consecutive page views within one session, counted sparsely
+  as `from << 32 | to` keys
+- paths: each session's page sequence (optionally its first `depth` pages),
+  counted by its raw bytes
+- funnels: for each step, the earliest position in every session where the
+  step's page follows the previous step (not necessarily directly)
+
+The transition counts and the count of every full session path are kept
+current from the store's append callback: a batch of rows only touches the
+sessions it extends or opens, whose old transitions and path are swapped
+for the new ones. The session ordering itself has two levels, like a small
+LSM tree: the bulk of the rows in one sorted run, and the sessions touched
+since its last rebuild in a small sorted run of their own (their rows in the
+main run are marked dead). Appends only splice the small run; it is folded
+into the main one once it passes a fraction of the rows, or when a query
+needs the full ordering.
+"""
+
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# The small run is folded into the main one past max(MERGE_MIN_ROWS,
+# rows / MERGE_FRACTION) rows, so a fold's O(rows) copy is amortized over
+# at least that many appended rows
+MERGE_MIN_ROWS = 4096
+MERGE_FRACTION = 32
+
+# Session number, timestamp, row and page code of rows in session order
+_Run = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def _empty_run() -> _Run:
+    return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+
+
+def _take(run: _Run, index: np.ndarray) -> _Run:
+    return tuple(column[index] for column in run)
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of the index ranges [start, end)"""
+    lengths = ends - starts
+    offsets = np.repeat(ends - np.cumsum(lengths), lengths)
+    return np.arange(int(lengths.sum()), dtype=np.int64) + offsets
+
+
+def _session_ranges(run: _Run, sessions: np.ndarray) -> np.ndarray:
+    """Positions of the rows of `sessions` (ascending) in a run"""
+    return _ranges(np.searchsorted(run[0], sessions, side='left'), np.searchsorted(run[0], sessions, side='right'))
+
+
+def _splice(run: _Run, removed: np.ndarray, block: _Run) -> _Run:
+    """A run without the positions `removed` and with the sorted `block` merged in by session"""
+    remaining = tuple(np.delete(column, removed) for column in run)
+    at = np.searchsorted(remaining[0], block[0])
+    return tuple(np.insert(column, at, values) for column, values in zip(remaining, block))
+
+
+def _pair_keys(session: np.ndarray, pages: np.ndarray) -> np.ndarray:
+    """`from << 32 | to` key of every consecutive page view within a session"""
+    same = session[1:] == session[:-1]
+    return (pages[:-1][same] << 32) | pages[1:][same]
+
+
+def _path_bytes(session: np.ndarray, pages: np.ndarray) -> List[bytes]:
+    """Page sequence of every session in session order, as int32 bytes"""
+    if not len(session):
+        return []
+    starts = np.flatnonzero(np.r_[True, session[1:] != session[:-1]])
+    ends = np.r_[starts[1:], len(session)]
+    data = pages.astype(np.int32).tobytes()
+    return [data[start * 4:end * 4] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+class SessionPaths:
+    """Path analysis over the sessions of a SessionTable"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.store = sessions.store
+        # Main run, with a flag per position telling if it is still current,
+        # and the small run of the sessions touched since the main run was built
+        self._main: _Run = _empty_run()
+        self._live = np.zeros(0, dtype=bool)
+        self._recent: _Run = _empty_run()
+        # Transition counts by `from << 32 | to`, and sessions per full path
+        self._transitions: Dict[int, int] = {}
+        self._paths: Counter = Counter()
+        # Path counts cut to a depth, valid for one store version
+        self._depth_version: Optional[int] = None
+        self._depth_paths: Dict[int, Counter] = {}
+        self.update(range(len(self.store)))
+        # Subscribed after the session table, so new rows already have sessions
+        self.store.subscribe(self.update)
+
+    def update(self, rows: range):
+        """Merge a batch of newly appended rows into the sessions they belong to"""
+        if not len(rows):
+            return
+        store = self.store
+        rows = np.arange(rows.start, rows.stop, dtype=np.int64)
+        session = self.sessions.row_session[rows]
+        affected = np.unique(session)
+
+        # Rows already held for the affected sessions: in the small run, or
+        # still live in the main run. Each session lies wholly in one run, so
+        # `old` is in session order per session
+        in_main = _session_ranges(self._main, affected)
+        in_main = in_main[self._live[in_main]]
+        in_recent = _session_ranges(self._recent, affected)
+        old = tuple(
+            np.concatenate([main[in_main], recent[in_recent]])
+            for main, recent in zip(self._main, self._recent)
+        )
+        new = (
+            session,
+            store.column('timestamp')[rows].astype(np.int64),
+            rows,
+            store.column('page_visited')[rows].astype(np.int64),
+        )
+        block = tuple(np.concatenate(pair) for pair in zip(old, new))
+        block = _take(block, np.lexsort((block[2], block[1], block[0])))
+
+        transitions = self._transitions
+        keys, counts = np.unique(_pair_keys(old[0], old[3]), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            transitions[key] -= count
+            if not transitions[key]:
+                del transitions[key]
+        keys, counts = np.unique(_pair_keys(block[0], block[3]), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            transitions[key] = transitions.get(key, 0) + count
+
+        paths = self._paths
+        for path in _path_bytes(old[0], old[3]):
+            paths[path] -= 1
+            if not paths[path]:
+                del paths[path]
+        paths.update(_path_bytes(block[0], block[3]))
+
+        self._live[in_main] = False
+        self._recent = _splice(self._recent, in_recent, block)
+        if len(self._recent[0]) > max(MERGE_MIN_ROWS, len(self._main[0]) // MERGE_FRACTION):
+            self._fold()
+
+    def _fold(self):
+        """Fold the small run into the main one"""
+        if not len(self._recent[0]):
+            return
+        self._main = _splice(self._main, np.flatnonzero(~self._live), self._recent)
+        self._live = np.ones(len(self._main[0]), dtype=bool)
+        self._recent = _empty_run()
+
+    def _ordered(self):
+        """Session numbers and page codes of every row, in session order"""
+        self._fold()
+        return self._main[0], self._main[3]
+
+    def _selection(self, selected: Optional[np.ndarray]):
+        """Session order restricted to the `selected` session numbers (all when None)"""
+        session, pages = self._ordered()
+        if selected is None:
+            return session, pages
+        keep = np.zeros(len(self.sessions), dtype=bool)
+        keep[selected] = True
+        mask = keep[session]
+        return session[mask], pages[mask]
+
+    def transitions(self, selected: Optional[np.ndarray] = None, top: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Observed page-to-page transitions by descending count, with the share of
+        all transitions out of the `from` page.
+        """
+        if selected is None:
+            keys = np.fromiter(self._transitions.keys(), dtype=np.int64, count=len(self._transitions))
+            counts = np.fromiter(self._transitions.values(), dtype=np.int64, count=len(self._transitions))
+            sort = np.argsort(keys)
+            keys, counts = keys[sort], counts[sort]
+        else:
+            keys, counts = np.unique(_pair_keys(*self._selection(selected)), return_counts=True)
+        names = self.store.dictionary('page_visited')
+        sources, targets = keys >> 32, keys & 0xFFFFFFFF
+        outgoing = np.bincount(sources, weights=counts, minlength=len(names))
+
+        order = np.argsort(-counts, kind='stable')
+        if top is not None:
+            order = order[:top]
+        return [
+            {
+                'from': names[source],
+                'to': names[target],
+                'count': count,
+                'probability': count / float(outgoing[source]),
+            }
+            for source, target, count in zip(sources[order].tolist(), targets[order].tolist(), counts[order].tolist())
+        ]
+
+    def _paths_to_depth(self, depth: int) -> Counter:
+        """Sessions per path cut to its first `depth` pages, cached for the store version"""
+        if self._depth_version != self.store.version:
+            self._depth_paths = {}
+            self._depth_version = self.store.version
+        counter = self._depth_paths.get(depth)
+        if counter is None:
+            counter = self._depth_paths[depth] = Counter()
+            for path, count in self._paths.items():
+                counter[path[:depth * 4]] += count
+        return counter
+
+    def paths(self, selected: Optional[np.ndarray] = None, top: int = 10, depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """The `top` most common page sequences, truncated to `depth` pages if given"""
+        if selected is None:
+            counter = self._paths if depth is None else self._paths_to_depth(depth)
+        else:
+            session, pages = self._selection(selected)
+            counter = Counter(path if depth is None else path[:depth * 4] for path in _path_bytes(session, pages))
+
+        names = self.store.dictionary('page_visited')
+        return [
+            {'path': [names[code] for code in np.frombuffer(path, dtype=np.int32).tolist()], 'sessions': count}
+            for path, count in counter.most_common(top)
+        ]
+
+    def funnel(self, steps: Sequence[str], selected: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Sessions reaching each funnel step in order (later steps need not follow
+        immediately), with the conversion from the first step and the drop-off
+        from the previous one.
+        """
+        session, pages = self._selection(selected)
+        n = len(self.sessions)
+        position = np.arange(len(session), dtype=np.int64)
+        never = np.iinfo(np.int64).max
+        reached = np.full(n, -1, dtype=np.int64)
+
+        funnel = []
+        for i, page in enumerate(steps):
+            code = self.store.code_of('page_visited', page)
+            earliest = np.full(n, never, dtype=np.int64)
+            if code is not None:
+                hits = pages == code
+                if i:
+                    # Only hits after the session reached the previous step
+                    previous = reached[session]
+                    hits &= (previous >= 0) & (position > previous)
+                np.minimum.at(earliest, session[hits], position[hits])
+            reached = np.where(earliest < never, earliest, -1)
+
+            count = int(np.count_nonzero(reached >= 0))
+            first = funnel[0]['sessions'] if funnel else count
+            previous_count = funnel[-1]['sessions'] if funnel else count
+            funnel.append({
+                'page': page,
+                'sessions': count,
+                'conversion_rate': count / first if first else 0.0,
+                'drop_off': 1 - count / previous_count if previous_count else 0.0,
+            })
+        return funnel
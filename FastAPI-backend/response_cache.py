@@ -0,0 +1,120 @@
+"""LRU cache of rendered GET responses, invalidated by a data version.
+
+Entries are keyed by the request path and its normalized (sorted) query
+string and remember the data version they were rendered for; once the
+version moves on they are treated as misses. ETags are derived from the
+same key and version, so a client revalidating with `If-None-Match` gets a
+304 without the endpoint running at all while the data is unchanged.
+"""
+
+import hashlib
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+# Response headers that belong to the cached body and are replayed with it
+_STORED_HEADERS = ("content-encoding", "vary")
+
+
+class CachedResponse(NamedTuple):
+    version: int
+    body: bytes
+    media_type: str
+    headers: dict
+
+
+class ResponseCache:
+    """Bounded LRU of response bodies, limited by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, instance: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        # Distinguishes ETags issued by different processes/restarts, whose
+        # version counters start over; processes whose versions agree (such as
+        # workers sharing one store) pass the same instance
+        self.instance = instance or uuid.uuid4().hex[:8]
+
+    @staticmethod
+    def key(request: Request) -> str:
+        """Path plus query parameters in a canonical order and the accepted encodings"""
+        query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{query} {request.headers.get('accept-encoding', '')}"
+
+    def etag(self, key: str, version: int) -> str:
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return f'"{self.instance}-{version}-{digest}"'
+
+    def get(self, key: str, version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, version: int, body: bytes, media_type: str, headers: Optional[dict] = None):
+        if len(body) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.body)
+        self._entries[key] = CachedResponse(version, body, media_type, headers or {})
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+def _if_none_match(request: Request) -> List[str]:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Answers GET requests from a ResponseCache while `version()` is unchanged.
+
+    Only successful JSON responses are stored; streamed formats such as
+    NDJSON pass straight through.
+    """
+
+    def __init__(self, app, cache: ResponseCache, version: Callable[[], int]):
+        super().__init__(app)
+        self.cache = cache
+        self.version = version
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method != "GET":
+            return await call_next(request)
+
+        version = self.version()
+        key = self.cache.key(request)
+        etag = self.cache.etag(key, version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+        if etag in _if_none_match(request):
+            return Response(status_code=304, headers=headers)
+        cached = self.cache.get(key, version)
+        if cached is not None:
+            return Response(cached.body, media_type=cached.media_type, headers={**cached.headers, **headers})
+
+        response = await call_next(request)
+        media_type = response.headers.get("content-type", "")
+        if response.status_code != 200 or media_type != "application/json":
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        stored = {name: response.headers[name] for name in _STORED_HEADERS if name in response.headers}
+        self.cache.put(key, version, body, media_type, stored)
+        return Response(body, media_type=media_type, headers={**stored, **headers})
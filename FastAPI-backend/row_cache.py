@@ -0,0 +1,53 @@
+"""Pre-encoded JSON for every stored row.
+
+Rows are serialized once, exactly the way FastAPI renders a model inside a
+JSONResponse, and the bytes are kept so list responses can be assembled by
+joining them instead of running every row through the serializer again.
+
+Rows appended after the cache is attached are encoded at insert time; rows
+that were already in the store (e.g. loaded from a snapshot) are encoded
+the first time they are read, so a cold start does not pay for it.
+"""
+
+import json
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def encode_entry(entry) -> bytes:
+    """Bytes FastAPI's JSONResponse would produce for `entry`"""
+    return json.dumps(
+        entry.model_dump(mode="json"),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class EncodedRowCache:
+    """Encoded JSON bytes per row id of a WeblogStore"""
+
+    def __init__(self, store):
+        self.store = store
+        self._rows: List[Optional[bytes]] = [None] * len(store)
+        store.subscribe(self.update)
+
+    def update(self, rows: range):
+        """Encode newly appended rows"""
+        self._rows.extend(encode_entry(entry) for entry in self.store.entries(rows))
+
+    def encoded(self, rows: Sequence[int]) -> List[bytes]:
+        """Encoded bytes for `rows`, encoding any that were never serialized"""
+        rows = np.asarray(rows, dtype=np.int64).tolist()
+        cache = self._rows
+        missing = [row for row in rows if cache[row] is None]
+        if missing:
+            for row, entry in zip(missing, self.store.entries(missing)):
+                cache[row] = encode_entry(entry)
+        return [cache[row] for row in rows]
+
+    def json_array(self, rows: Sequence[int]) -> bytes:
+        """A JSON array of the given rows, byte-identical to serializing the models"""
+        return b"[" + b",".join(self.encoded(rows)) + b"]"
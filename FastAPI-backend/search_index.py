@@ -0,0 +1,113 @@
+"""Substring search over visitors, backed by an n-gram index.
+
+Search runs over the dictionaries of a few string fields rather than over
+rows: every distinct value is lowercased and broken into its n-grams of
+length 1 to GRAM_SIZE, and each gram maps to the codes of the values that
+contain it. A term up to GRAM_SIZE characters long is answered by a single
+gram lookup; a longer term intersects the postings of its grams and checks
+the few surviving values directly.
+
+For every field other than `visitor_id`, each value also keeps the visitors
+that have a row holding it, so matched values turn into visitors without
+touching the rows. Both structures are updated on insert.
+"""
+
+from array import array
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+# Fields searched by default
+SEARCH_FIELDS = ('visitor_id', 'city', 'region', 'country', 'page_visited', 'page_title', 'utm_source')
+
+GRAM_SIZE = 3
+
+
+def _grams(value: str, size: int) -> Set[str]:
+    """Every substring of `value` of length 1 to `size`"""
+    return {value[start:start + length] for length in range(1, size + 1) for start in range(len(value) - length + 1)}
+
+
+class SearchIndex:
+    """N-gram index from search terms to the visitors whose rows contain them"""
+
+    def __init__(self, store, fields: Sequence[str] = SEARCH_FIELDS):
+        self.store = store
+        self.fields = list(fields)
+        self._lowered: Dict[str, List[str]] = {name: [] for name in self.fields}
+        self._grams: Dict[str, Dict[str, array]] = {name: {} for name in self.fields}
+        # Visitor codes per value code, and the (value, visitor) pairs already posted
+        self._visitors: Dict[str, List[array]] = {name: [] for name in self.fields}
+        self._pairs: Dict[str, Set[int]] = {name: set() for name in self.fields}
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def _index_values(self, name: str):
+        """Add dictionary values that appeared since the last update to the gram postings"""
+        values = self.store.dictionary(name)
+        lowered = self._lowered[name]
+        grams = self._grams[name]
+        for code in range(len(lowered), len(values)):
+            value = values[code].lower()
+            lowered.append(value)
+            for gram in _grams(value, GRAM_SIZE):
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array('q')
+                postings.append(code)
+
+    def update(self, rows: range):
+        """Index new values and post new (value, visitor) pairs from a batch of rows"""
+        if not len(rows):
+            return
+        store = self.store
+        rows = slice(rows.start, rows.stop)
+        visitors = store.column('visitor_id')[rows].astype(np.int64)
+        for name in self.fields:
+            self._index_values(name)
+            if name == 'visitor_id':
+                continue
+            postings, seen = self._visitors[name], self._pairs[name]
+            while len(postings) < len(self._lowered[name]):
+                postings.append(array('q'))
+            keys = np.unique((store.column(name)[rows].astype(np.int64) << 32) | visitors)
+            for key in keys.tolist():
+                if key not in seen:
+                    seen.add(key)
+                    postings[key >> 32].append(key & 0xFFFFFFFF)
+
+    def values_matching(self, name: str, term: str) -> np.ndarray:
+        """Codes of the values of `name` containing `term` (case-insensitive), ascending"""
+        term = term.lower()
+        grams = self._grams[name]
+        if len(term) <= GRAM_SIZE:
+            postings = grams.get(term)
+            return np.frombuffer(postings, dtype=np.int64).copy() if postings is not None else np.empty(0, dtype=np.int64)
+
+        pieces = [grams.get(term[start:start + GRAM_SIZE]) for start in range(len(term) - GRAM_SIZE + 1)]
+        if any(postings is None for postings in pieces):
+            return np.empty(0, dtype=np.int64)
+        pieces.sort(key=len)
+        candidates = np.frombuffer(pieces[0], dtype=np.int64)
+        for postings in pieces[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, np.frombuffer(postings, dtype=np.int64), assume_unique=True)
+        lowered = self._lowered[name]
+        return np.array([code for code in candidates.tolist() if term in lowered[code]], dtype=np.int64)
+
+    def visitors_with(self, name: str, codes: np.ndarray) -> np.ndarray:
+        """Visitor codes with a row holding any of the value `codes` of `name`"""
+        if name == 'visitor_id':
+            return np.asarray(codes, dtype=np.int64)
+        postings = self._visitors[name]
+        # frombuffer views are safe here: concatenate copies them before the postings can grow
+        parts = [np.frombuffer(postings[code], dtype=np.int64) for code in np.asarray(codes).tolist()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def search(self, term: str, fields: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Ascending codes of the visitors with any row whose `fields` contain `term`"""
+        mask = np.zeros(len(self.store.dictionary('visitor_id')), dtype=bool)
+        for name in fields or self.fields:
+            mask[self.visitors_with(name, self.values_matching(name, term))] = True
+        return np.flatnonzero(mask)
@@ -0,0 +1,273 @@
+"""Session table maintained incrementally from a WeblogStore.
+
+Rows are grouped into sessions by `session_id`. A row more than
+`idle_timeout` away from the latest session with its id closes that session
+and starts a new one, so a reused id or a visitor returning hours later
+does not merge into one long session. Sessions are numbered in the order
+they are opened.
+
+Each session has a slot in a set of NumPy arrays (first/last timestamp,
+page views, time on page, engagement, entry/exit rows, conversion), updated
+for every batch of appended rows, so listing and summarizing sessions costs
+O(sessions) instead of regrouping the page views.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from weblog_store import grow
+
+# Default gap after which a session is considered over (30 minutes, in µs)
+IDLE_TIMEOUT = 30 * 60 * 1_000_000
+
+# Sort keys accepted by SessionTable.query
+SORT_KEYS = (
+    'start_desc', 'start_asc',
+    'duration_desc', 'duration_asc',
+    'page_views_desc', 'page_views_asc',
+)
+
+
+class SessionTable:
+    """Per-session metrics kept current as rows are appended to the store"""
+
+    def __init__(self, store, idle_timeout: int = IDLE_TIMEOUT):
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self.count = 0
+        self.session_code = np.zeros(0, dtype=np.int64)
+        self.start = np.zeros(0, dtype=np.int64)
+        self.end = np.zeros(0, dtype=np.int64)
+        self.page_views = np.zeros(0, dtype=np.int64)
+        self.time_sum = np.zeros(0, dtype=np.int64)
+        self.engagement_sum = np.zeros(0, dtype=np.float64)
+        self.converted = np.zeros(0, dtype=bool)
+        # Rows of the first and last page view (source of visitor, device and
+        # location, and of the entry and exit pages)
+        self.entry_row = np.zeros(0, dtype=np.int64)
+        self.exit_row = np.zeros(0, dtype=np.int64)
+        # Session number of every row
+        self.row_session = np.zeros(0, dtype=np.int64)
+        # Latest session opened for each session_id code, or -1
+        self.current = np.zeros(0, dtype=np.int64)
+        # Latest timestamp seen, the reference for whether a session is still open
+        self.latest = np.iinfo(np.int64).min
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _reserve(self, size: int):
+        self.session_code = grow(self.session_code, size)
+        self.start = grow(self.start, size)
+        self.end = grow(self.end, size)
+        self.page_views = grow(self.page_views, size)
+        self.time_sum = grow(self.time_sum, size)
+        self.engagement_sum = grow(self.engagement_sum, size)
+        self.converted = grow(self.converted, size, fill=False)
+        self.entry_row = grow(self.entry_row, size)
+        self.exit_row = grow(self.exit_row, size)
+
+    def update(self, rows: range):
+        """Assign a batch of newly appended rows to sessions and fold them in"""
+        if not len(rows):
+            return
+        store = self.store
+        self.current = grow(self.current, len(store.dictionary('session_id')), fill=-1)
+        # Every row could open a session
+        self._reserve(self.count + len(rows))
+        rows = np.arange(rows.start, rows.stop, dtype=np.int64)
+        codes = store.column('session_id')[rows].astype(np.int64)
+        timestamps = store.column('timestamp')[rows]
+        self.latest = max(self.latest, int(timestamps.max()))
+
+        # Walk each session_id's rows in time order; a new session starts at
+        # a gap longer than the idle timeout
+        order = np.lexsort((rows, timestamps, codes))
+        rows, codes, timestamps = rows[order], codes[order], timestamps[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        breaks = np.zeros(len(rows), dtype=bool)
+        breaks[1:] = ~first[1:] & (np.diff(timestamps) > self.idle_timeout)
+
+        # The first row of each id continues its current session when close enough
+        current = self.current[codes[first]]
+        known = current >= 0
+        safe = np.where(known, current, 0)
+        gap = np.maximum(timestamps[first] - self.end[safe], self.start[safe] - timestamps[first])
+        breaks[first] = ~known | (gap > self.idle_timeout)
+
+        # Contiguous runs of rows belonging to one session
+        run_starts = first | breaks
+        run = np.cumsum(run_starts) - 1
+        n_new = int(breaks.sum())
+        slot_of_run = np.empty(int(run_starts.sum()), dtype=np.int64)
+        new_runs = breaks[run_starts]
+        slot_of_run[new_runs] = np.arange(self.count, self.count + n_new)
+        slot_of_run[~new_runs] = current[~breaks[first]]
+        slots = slot_of_run[run]
+
+        opened = slot_of_run[new_runs]
+        self.session_code[opened] = codes[run_starts][new_runs]
+        self.start[opened] = np.iinfo(np.int64).max
+        self.end[opened] = np.iinfo(np.int64).min
+        self.count += n_new
+
+        self.row_session = grow(self.row_session, len(store))
+        self.row_session[rows] = slots
+        np.add.at(self.page_views, slots, 1)
+        np.add.at(self.time_sum, slots, store.column('time_on_page_seconds')[rows])
+        np.add.at(self.engagement_sum, slots, store.column('engagement_score')[rows])
+        np.logical_or.at(self.converted, slots, store.column('is_converted')[rows])
+
+        # Each run is in time order, so its first and last rows are the
+        # entry and exit candidates (earliest row wins a tie for entry,
+        # latest row for exit)
+        run_ends = np.ones(len(rows), dtype=bool)
+        run_ends[:-1] = run_starts[1:]
+        head_slots, head_rows, head_ts = slots[run_starts], rows[run_starts], timestamps[run_starts]
+        earlier = head_ts < self.start[head_slots]
+        self.entry_row[head_slots[earlier]] = head_rows[earlier]
+        self.start[head_slots[earlier]] = head_ts[earlier]
+        tail_slots, tail_rows, tail_ts = slots[run_ends], rows[run_ends], timestamps[run_ends]
+        later = tail_ts >= self.end[tail_slots]
+        self.exit_row[tail_slots[later]] = tail_rows[later]
+        self.end[tail_slots[later]] = tail_ts[later]
+
+        # The last run of each id is its latest session unless it lies
+        # entirely before the session already current
+        last_of_id = np.ones(len(rows), dtype=bool)
+        last_of_id[:-1] = first[1:]
+        id_codes, id_slots = codes[last_of_id], slots[last_of_id]
+        previous = self.current[id_codes]
+        replace = (previous < 0) | (self.end[id_slots] >= self.end[np.where(previous >= 0, previous, 0)])
+        self.current[id_codes[replace]] = id_slots[replace]
+
+    def durations(self) -> np.ndarray:
+        """Seconds between the first and last page view of every session"""
+        n = self.count
+        return (self.end[:n] - self.start[:n]) / 1_000_000
+
+    def query(
+        self,
+        session_id: Optional[str] = None,
+        visitor_id: Optional[str] = None,
+        device_type: Optional[str] = None,
+        country: Optional[str] = None,
+        entry_page: Optional[str] = None,
+        exit_page: Optional[str] = None,
+        converted: Optional[bool] = None,
+        bounced: Optional[bool] = None,
+        is_open: Optional[bool] = None,
+        min_page_views: Optional[int] = None,
+        max_page_views: Optional[int] = None,
+        min_duration: Optional[float] = None,
+        max_duration: Optional[float] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        sort: str = 'start_desc',
+    ) -> np.ndarray:
+        """
+        Session numbers matching every given filter, in `sort` order.
+
+        Visitor, device and country come from the entry page view; `since` and
+        `until` (epoch microseconds) bound the session start. Ties keep the
+        order in which sessions were opened.
+        """
+        store = self.store
+        n = self.count
+        durations = self.durations()
+        page_views = self.page_views[:n]
+        mask = np.ones(n, dtype=bool)
+
+        equalities = (
+            ('session_id', session_id, None),
+            ('visitor_id', visitor_id, self.entry_row),
+            ('device_type', device_type, self.entry_row),
+            ('country', country, self.entry_row),
+            ('page_visited', entry_page, self.entry_row),
+            ('page_visited', exit_page, self.exit_row),
+        )
+        for name, value, source in equalities:
+            if value is None:
+                continue
+            code = store.code_of(name, value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            if source is None:
+                mask &= self.session_code[:n] == code
+            else:
+                mask &= store.column(name)[source[:n]] == code
+        if converted is not None:
+            mask &= self.converted[:n] == converted
+        if bounced is not None:
+            mask &= (page_views == 1) == bounced
+        if is_open is not None:
+            mask &= (self.latest - self.end[:n] <= self.idle_timeout) == is_open
+        if min_page_views is not None:
+            mask &= page_views >= min_page_views
+        if max_page_views is not None:
+            mask &= page_views <= max_page_views
+        if min_duration is not None:
+            mask &= durations >= min_duration
+        if max_duration is not None:
+            mask &= durations <= max_duration
+        if since is not None:
+            mask &= self.start[:n] >= since
+        if until is not None:
+            mask &= self.start[:n] <= until
+
+        sessions = np.flatnonzero(mask)
+        key_name, direction = sort.rsplit('_', 1)
+        keys = {
+            'start': self.start[:n],
+            'duration': durations,
+            'page_views': page_views,
+        }[key_name][sessions]
+        order = np.argsort(-keys if direction == 'desc' else keys, kind='stable')
+        return sessions[order]
+
+    def aggregate(self, sessions: np.ndarray) -> Dict[str, Any]:
+        """Count, bounce and conversion rates and average depth/duration of `sessions`"""
+        sessions = np.asarray(sessions, dtype=np.int64)
+        count = len(sessions)
+        if not count:
+            return {'count': 0}
+        page_views = self.page_views[sessions]
+        return {
+            'count': count,
+            'bounce_rate': float(np.count_nonzero(page_views == 1)) / count,
+            'conversion_rate': float(np.count_nonzero(self.converted[sessions])) / count,
+            'avg_page_views': float(page_views.mean()),
+            'avg_duration_seconds': float(self.durations()[sessions].mean()),
+            'avg_time_on_page_seconds': float(self.time_sum[sessions].sum()) / int(page_views.sum()),
+        }
+
+    def summaries(self, sessions: np.ndarray) -> List[Dict[str, Any]]:
+        """Summary dictionaries for the given session numbers"""
+        store = self.store
+        sessions = np.asarray(sessions, dtype=np.int64)
+        page_views = self.page_views[sessions]
+        entry, exit_ = self.entry_row[sessions], self.exit_row[sessions]
+        session_ids = store.dictionary('session_id')
+
+        columns = {
+            'session_id': [session_ids[code] for code in self.session_code[sessions].tolist()],
+            'visitor_id': store.values('visitor_id', entry),
+            'start': store.values('timestamp', entry),
+            'end': store.values('timestamp', exit_),
+            'duration_seconds': ((self.end[sessions] - self.start[sessions]) / 1_000_000).tolist(),
+            'page_views': page_views.tolist(),
+            'total_time_on_page': self.time_sum[sessions].tolist(),
+            'average_engagement_score': (self.engagement_sum[sessions] / page_views).tolist(),
+            'entry_page': store.values('page_visited', entry),
+            'exit_page': store.values('page_visited', exit_),
+            'is_bounce': (page_views == 1).tolist(),
+            'is_converted': self.converted[sessions].tolist(),
+            'is_open': (self.latest - self.end[sessions] <= self.idle_timeout).tolist(),
+            'device_type': store.values('device_type', entry),
+            'country': store.values('country', entry),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -0,0 +1,190 @@
+"""Fixed-size, mergeable sketches updated on every insert.
+
+For each value of a few dimensions (country, device type, page) two kinds of
+sketch are kept per dictionary code:
+
+- HyperLogLog registers estimating the number of distinct `visitor_id` and
+  `session_id` values (2**HLL_PRECISION one-byte registers each, about 1.6%
+  standard error)
+- log-bucketed histograms (DDSketch) of `page_load_time_ms` and
+  `time_on_page_seconds` answering any percentile within QUANTILE_ACCURACY
+  relative error
+
+Both merge by elementwise max/sum, so the sketch of a whole dimension is the
+merge of its values' sketches, and every query costs the same however many
+rows have been ingested.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from weblog_store import grow
+
+# Dimensions that get their own sketches
+DIMENSIONS = ('country', 'device_type', 'page_visited')
+# Fields counted approximately by HyperLogLog
+DISTINCT_FIELDS = ('visitor_id', 'session_id')
+# Fields whose percentiles are tracked
+QUANTILE_FIELDS = ('page_load_time_ms', 'time_on_page_seconds')
+
+HLL_PRECISION = 12
+QUANTILE_ACCURACY = 0.01
+QUANTILE_BUCKETS = 1024
+
+_HLL_REGISTERS = 1 << HLL_PRECISION
+_GAMMA = (1 + QUANTILE_ACCURACY) / (1 - QUANTILE_ACCURACY)
+_LOG_GAMMA = np.log(_GAMMA)
+
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash of a string, identical across processes and restarts"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of significant bits of each uint64"""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp is exact on 32-bit integers: x = m * 2**e with 0.5 <= m < 1
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def hll_positions(hashes: np.ndarray):
+    """Register index and rank (position of the first set bit) of each hash"""
+    hashes = hashes.astype(np.uint64)
+    index = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - _bit_length(rest) + 1
+    return index, rank.astype(np.uint8)
+
+
+def hll_estimate(registers: np.ndarray) -> float:
+    """Cardinality estimate from one set of HyperLogLog registers"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / float(np.sum(np.exp2(-registers.astype(np.float64))))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate while many registers are empty
+        return m * np.log(m / zeros)
+    return estimate
+
+
+def quantile_buckets(values: np.ndarray) -> np.ndarray:
+    """DDSketch bucket of each value; bucket 0 holds zero and negative values"""
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.zeros(len(values), dtype=np.int64)
+    positive = values > 0
+    indexes = np.ceil(np.log(np.maximum(values[positive], 1.0)) / _LOG_GAMMA).astype(np.int64)
+    buckets[positive] = np.clip(indexes + 1, 1, QUANTILE_BUCKETS - 1)
+    return buckets
+
+
+def quantiles(counts: np.ndarray, qs: Sequence[float]) -> List[Optional[float]]:
+    """Values at quantiles `qs` (0-1) of a DDSketch histogram"""
+    total = int(counts.sum())
+    if not total:
+        return [None for _ in qs]
+    cumulative = np.cumsum(counts)
+    results = []
+    for q in qs:
+        bucket = int(np.searchsorted(cumulative, q * (total - 1), side='right'))
+        results.append(0.0 if bucket == 0 else 2 * _GAMMA ** (bucket - 1) / (_GAMMA + 1))
+    return results
+
+
+class _Sketches:
+    """Sketches for one dimension, indexed by dictionary code"""
+
+    def __init__(self):
+        self.registers = {name: np.zeros((0, _HLL_REGISTERS), dtype=np.uint8) for name in DISTINCT_FIELDS}
+        self.histograms = {name: np.zeros((0, QUANTILE_BUCKETS), dtype=np.int64) for name in QUANTILE_FIELDS}
+
+    def reserve(self, size: int):
+        for name, registers in self.registers.items():
+            self.registers[name] = grow(registers, size)
+        for name, histogram in self.histograms.items():
+            self.histograms[name] = grow(histogram, size)
+
+
+class SketchAggregates:
+    """Per-dimension HyperLogLog and quantile sketches updated incrementally from a WeblogStore"""
+
+    def __init__(self, store, dimensions: Sequence[str] = DIMENSIONS):
+        self.store = store
+        self.dimensions = list(dimensions)
+        self.sketches: Dict[str, _Sketches] = {name: _Sketches() for name in self.dimensions}
+        # Hash of every dictionary value of the distinct-counted fields, by code
+        self._hashes = {name: np.zeros(0, dtype=np.uint64) for name in DISTINCT_FIELDS}
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def _value_hashes(self, name: str) -> np.ndarray:
+        values = self.store.dictionary(name)
+        hashes = self._hashes[name]
+        if len(hashes) < len(values):
+            new = np.fromiter((hash64(value) for value in values[len(hashes):]), dtype=np.uint64)
+            hashes = self._hashes[name] = np.concatenate([hashes, new])
+        return hashes
+
+    def update(self, rows: range):
+        """Add a batch of newly appended rows to every dimension's sketches"""
+        if not len(rows):
+            return
+        store = self.store
+        rows = slice(rows.start, rows.stop)
+        positions = {
+            name: hll_positions(self._value_hashes(name)[store.column(name)[rows]])
+            for name in DISTINCT_FIELDS
+        }
+        buckets = {name: quantile_buckets(store.column(name)[rows]) for name in QUANTILE_FIELDS}
+
+        for dimension, sketches in self.sketches.items():
+            codes = store.column(dimension)[rows].astype(np.int64)
+            sketches.reserve(len(store.dictionary(dimension)))
+            for name, (index, rank) in positions.items():
+                np.maximum.at(sketches.registers[name], (codes, index), rank)
+            for name, bucket in buckets.items():
+                np.add.at(sketches.histograms[name], (codes, bucket), 1)
+
+    def _summary(self, registers: Dict[str, np.ndarray], histograms: Dict[str, np.ndarray], percentiles: Sequence[float]) -> Dict[str, Any]:
+        qs = [p / 100 for p in percentiles]
+        return {
+            'count': int(histograms[QUANTILE_FIELDS[0]].sum()),
+            'distinct': {name: int(round(hll_estimate(registers[name]))) for name in DISTINCT_FIELDS},
+            'percentiles': {
+                name: {f'p{p:g}': value for p, value in zip(percentiles, quantiles(histograms[name], qs))}
+                for name in QUANTILE_FIELDS
+            },
+        }
+
+    def summary(self, dimension: Optional[str] = None, percentiles: Sequence[float] = (50, 95, 99)) -> List[Dict[str, Any]]:
+        """
+        Estimated distinct visitors/sessions and percentiles per value of
+        `dimension`, ordered by descending count, or a single overall summary
+        (the merge of every value's sketches) when no dimension is given.
+        """
+        if dimension is None:
+            sketches = self.sketches[self.dimensions[0]]
+            n = len(self.store.dictionary(self.dimensions[0]))
+            return [self._summary(
+                {name: registers[:n].max(axis=0, initial=0) for name, registers in sketches.registers.items()},
+                {name: histogram[:n].sum(axis=0) for name, histogram in sketches.histograms.items()},
+                percentiles,
+            )]
+
+        sketches = self.sketches[dimension]
+        values = self.store.dictionary(dimension)
+        counts = sketches.histograms[QUANTILE_FIELDS[0]][:len(values)].sum(axis=1)
+        summaries = []
+        for code in np.argsort(-counts, kind='stable').tolist():
+            summary = {dimension: values[code]}
+            summary.update(self._summary(
+                {name: registers[code] for name, registers in sketches.registers.items()},
+                {name: histogram[code] for name, histogram in sketches.histograms.items()},
+                percentiles,
+            ))
+            summaries.append(summary)
+        return summaries
@@ -0,0 +1,187 @@
+"""Per-visitor rollups maintained incrementally from a WeblogStore.
+
+Each visitor (by the dictionary code of `visitor_id`) has a slot in a set of
+NumPy arrays holding page views, engagement and time-on-page totals, the
+latest visit, and the first converting row. The arrays are updated for every
+batch of appended rows, so listing, filtering and sorting visitors costs
+O(visitors) instead of regrouping the whole log.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from weblog_store import grow
+
+# Sort keys accepted by VisitorRollups.query, mirroring the Dashboard options
+SORT_KEYS = (
+    'last_visit_desc', 'last_visit_asc',
+    'engagement_desc', 'engagement_asc',
+    'page_views_desc', 'page_views_asc',
+    'avg_time_spent_desc', 'avg_time_spent_asc',
+)
+
+
+class VisitorRollups:
+    """Per-visitor totals kept current as rows are appended to the store"""
+
+    def __init__(self, store, search_index):
+        self.store = store
+        self.search_index = search_index
+        self.page_views = np.zeros(0, dtype=np.int64)
+        self.engagement_sum = np.zeros(0, dtype=np.float64)
+        self.time_sum = np.zeros(0, dtype=np.int64)
+        self.last_visit = np.zeros(0, dtype=np.int64)
+        # Row of the latest visit (source of country/city/device) and of the
+        # first conversion, or -1
+        self.latest_row = np.zeros(0, dtype=np.int64)
+        self.conversion_row = np.zeros(0, dtype=np.int64)
+        self.update(range(len(store)))
+        store.subscribe(self.update)
+
+    def __len__(self) -> int:
+        return len(self.store.dictionary('visitor_id'))
+
+    def _reserve(self, size: int):
+        self.page_views = grow(self.page_views, size)
+        self.engagement_sum = grow(self.engagement_sum, size)
+        self.time_sum = grow(self.time_sum, size)
+        self.last_visit = grow(self.last_visit, size)
+        self.latest_row = grow(self.latest_row, size, fill=-1)
+        self.conversion_row = grow(self.conversion_row, size, fill=-1)
+
+    def update(self, rows: range):
+        """Fold a batch of newly appended rows into the rollups"""
+        if not len(rows):
+            return
+        store = self.store
+        self._reserve(len(self))
+        rows = np.arange(rows.start, rows.stop, dtype=np.int64)
+        codes = store.column('visitor_id')[rows].astype(np.int64)
+        timestamps = store.column('timestamp')[rows]
+
+        np.add.at(self.page_views, codes, 1)
+        np.add.at(self.engagement_sum, codes, store.column('engagement_score')[rows])
+        np.add.at(self.time_sum, codes, store.column('time_on_page_seconds')[rows])
+
+        # Latest row per visitor in this batch (earliest row wins a timestamp tie)
+        order = np.lexsort((rows, -timestamps, codes))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = codes[order][1:] != codes[order][:-1]
+        best = order[first]
+        best_codes, best_rows, best_ts = codes[best], rows[best], timestamps[best]
+        newer = (self.latest_row[best_codes] < 0) | (best_ts > self.last_visit[best_codes])
+        self.latest_row[best_codes[newer]] = best_rows[newer]
+        self.last_visit[best_codes[newer]] = best_ts[newer]
+
+        # First converting row per visitor
+        is_converted = store.column('is_converted')[rows]
+        if is_converted.any():
+            converted_codes, first_index = np.unique(codes[is_converted], return_index=True)
+            converted_rows = rows[is_converted][first_index]
+            unset = self.conversion_row[converted_codes] < 0
+            self.conversion_row[converted_codes[unset]] = converted_rows[unset]
+
+    def averages(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Average engagement score and average time on page per visitor"""
+        n = len(self)
+        page_views = self.page_views[:n]
+        return self.engagement_sum[:n] / page_views, self.time_sum[:n] / page_views
+
+    def _matches_search(self, term: str) -> np.ndarray:
+        """Visitors whose id, latest country/city, or any visited page/title/source contains `term`"""
+        store = self.store
+        index = self.search_index
+        n = len(self)
+
+        mask = np.zeros(n, dtype=bool)
+        mask[index.values_matching('visitor_id', term)] = True
+        latest = self.latest_row[:n]
+        for name in ('country', 'city'):
+            mask |= np.isin(store.column(name)[latest], index.values_matching(name, term))
+        for name in ('page_visited', 'page_title', 'utm_source'):
+            mask[index.visitors_with(name, index.values_matching(name, term))] = True
+        return mask
+
+    def query(
+        self,
+        search: Optional[str] = None,
+        device_type: Optional[str] = None,
+        converted: Optional[bool] = None,
+        min_engagement: Optional[float] = None,
+        max_engagement: Optional[float] = None,
+        last_visit_from: Optional[int] = None,
+        last_visit_to: Optional[int] = None,
+        min_avg_time: Optional[float] = None,
+        max_avg_time: Optional[float] = None,
+        sort: str = 'last_visit_desc',
+    ) -> np.ndarray:
+        """
+        Visitor codes matching every given filter, in `sort` order.
+
+        Filters mirror the Dashboard controls; timestamps are epoch microseconds.
+        Ties keep the order in which visitors first appeared.
+        """
+        store = self.store
+        n = len(self)
+        avg_engagement, avg_time = self.averages()
+        mask = np.ones(n, dtype=bool)
+
+        if search:
+            mask &= self._matches_search(search)
+        if device_type:
+            code = store.code_of('device_type', device_type)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= store.column('device_type')[self.latest_row[:n]] == code
+        if converted is not None:
+            mask &= (self.conversion_row[:n] >= 0) == converted
+        if min_engagement is not None:
+            mask &= avg_engagement >= min_engagement
+        if max_engagement is not None:
+            mask &= avg_engagement <= max_engagement
+        if last_visit_from is not None:
+            mask &= self.last_visit[:n] >= last_visit_from
+        if last_visit_to is not None:
+            mask &= self.last_visit[:n] <= last_visit_to
+        if min_avg_time is not None:
+            mask &= avg_time >= min_avg_time
+        if max_avg_time is not None:
+            mask &= avg_time <= max_avg_time
+
+        codes = np.flatnonzero(mask)
+        key_name, direction = sort.rsplit('_', 1)
+        keys = {
+            'last_visit': self.last_visit[:n],
+            'engagement': avg_engagement,
+            'page_views': self.page_views[:n],
+            'avg_time_spent': avg_time,
+        }[key_name][codes]
+        order = np.argsort(-keys if direction == 'desc' else keys, kind='stable')
+        return codes[order]
+
+    def summaries(self, codes: np.ndarray) -> List[dict]:
+        """Summary dictionaries for the given visitor codes"""
+        store = self.store
+        codes = np.asarray(codes, dtype=np.int64)
+        page_views = self.page_views[codes]
+        latest = self.latest_row[codes]
+        conversion = self.conversion_row[codes]
+        converted_rows = np.where(conversion >= 0, conversion, 0)
+
+        columns = {
+            'visitor_id': [store.dictionary('visitor_id')[code] for code in codes.tolist()],
+            'total_page_views': page_views.tolist(),
+            'average_engagement_score': (self.engagement_sum[codes] / page_views).tolist(),
+            'average_time_on_page': (self.time_sum[codes] / page_views).tolist(),
+            'last_visit_timestamp': store.values('timestamp', latest),
+            'is_converted': (conversion >= 0).tolist(),
+            'conversion_type': [
+                (value or None) if is_converted else None
+                for value, is_converted in zip(store.values('conversion_type', converted_rows), (conversion >= 0).tolist())
+            ],
+            'country': store.values('country', latest),
+            'city': store.values('city', latest),
+            'device_type': store.values('device_type', latest),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -0,0 +1,734 @@
+"""Column-oriented in-memory storage for weblog rows.
+
+Every field of the Pydantic model gets its own column: numbers and booleans
+live in NumPy arrays, timestamps are kept as UTC epoch microseconds, and
+strings are dictionary-encoded so that repeated values (country, browser,
+user agent, ...) are stored once and each row only holds an integer code.
+Model instances are only built when rows leave the store.
+
+A store can be saved as a snapshot directory holding one `.npy` file per
+column plus a `manifest.json` with the schema, string dictionaries and
+caller-supplied metadata, and loaded back without re-validating any rows.
+Large dictionaries go to their own JSON file so the manifest stays small.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_INITIAL_CAPACITY = 1024
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_EPOCH_NAIVE = datetime.datetime(1970, 1, 1)
+_ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# Column kind -> NumPy dtype of the per-row array
+_DTYPES = {
+    'timestamp': np.int64,
+    'int': np.int64,
+    'float': np.float64,
+    'bool': np.bool_,
+    'string': np.int32,
+}
+
+# Bumped whenever the snapshot layout changes; older snapshots are ignored
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+# Suffix of the previous snapshot while a new one is swapped in
+_ASIDE_SUFFIX = '.old'
+# Dictionaries with more values than this are written to their own file
+INLINE_DICTIONARY_LIMIT = 4096
+
+# Hidden column remembering each timestamp's UTC offset (seconds, or None
+# for naive datetimes) so rows round-trip exactly
+_TZ_COLUMN = '_utcoffset'
+
+
+def _column_kind(annotation) -> str:
+    if annotation is datetime.datetime:
+        return 'timestamp'
+    if annotation is bool:
+        return 'bool'
+    if annotation is int:
+        return 'int'
+    if annotation is float:
+        return 'float'
+    return 'string'
+
+
+def grow(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """Return `array` enlarged along its first axis (by at least doubling) to hold `size` items"""
+    if size <= len(array):
+        return array
+    grown = np.full((max(size, 2 * len(array)),) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def to_epoch_us(value: datetime.datetime) -> int:
+    """Convert a datetime to epoch microseconds (naive values are taken as UTC)"""
+    if value.tzinfo is None:
+        return (value - _EPOCH_NAIVE) // _ONE_MICROSECOND
+    return (value - _EPOCH) // _ONE_MICROSECOND
+
+
+def from_epoch_us(us: int, offset: Optional[int] = 0) -> datetime.datetime:
+    """Rebuild a datetime from epoch microseconds and a UTC offset in seconds"""
+    value = _EPOCH + datetime.timedelta(microseconds=int(us))
+    if offset is None:
+        return value.replace(tzinfo=None)
+    if offset:
+        return value.astimezone(datetime.timezone(datetime.timedelta(seconds=offset)))
+    return value
+
+
+def columnar_records(model, records: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Model instances as one array per field, encoded like WeblogStore.columnar:
+    strings as a dictionary of the values present plus codes, timestamps as
+    UTC epoch microseconds.
+    """
+    columns: Dict[str, Any] = {}
+    for name, field in model.model_fields.items():
+        kind = _column_kind(field.annotation)
+        values = [getattr(record, name) for record in records]
+        if kind == 'string':
+            dictionary: Dict[Any, int] = {}
+            codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+            columns[name] = {'type': 'dictionary', 'dictionary': list(dictionary), 'codes': codes}
+        elif kind == 'timestamp':
+            columns[name] = {'type': 'timestamp', 'unit': 'us', 'values': [to_epoch_us(value) for value in values]}
+        else:
+            columns[name] = {'type': kind, 'values': values}
+    return {'rows': len(records), 'columns': columns}
+
+
+class HashIndex:
+    """
+    Equality index mapping each dictionary code to the ascending row ids holding
+    it. Rows present when the index is built are held as one array of row ids
+    grouped by code with per-code offsets; rows appended later go to small
+    per-code postings, which always hold the larger row ids.
+    """
+
+    def __init__(self):
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._grouped = np.empty(0, dtype=np.int64)
+        self._postings: Dict[int, array] = {}
+
+    def add(self, code: int, row: int):
+        postings = self._postings.get(code)
+        if postings is None:
+            postings = self._postings[code] = array('q')
+        postings.append(row)
+
+    def _built(self, code: int) -> np.ndarray:
+        if code + 1 >= len(self._offsets):
+            return self._grouped[:0]
+        return self._grouped[self._offsets[code]:self._offsets[code + 1]]
+
+    def count(self, code: int) -> int:
+        postings = self._postings.get(code)
+        return len(self._built(code)) + (len(postings) if postings is not None else 0)
+
+    def extend(self, codes: np.ndarray, first_row: int):
+        """Add consecutive rows `first_row, first_row + 1, ...` holding `codes`"""
+        if not len(codes):
+            return
+        order = np.argsort(codes, kind='stable')
+        rows = order + first_row
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for start, end in zip([0] + bounds.tolist(), bounds.tolist() + [len(order)]):
+            code = int(codes[order[start]])
+            postings = self._postings.get(code)
+            if postings is None:
+                postings = self._postings[code] = array('q')
+            postings.frombytes(rows[start:end].astype(np.int64).tobytes())
+
+    @classmethod
+    def build(cls, codes: np.ndarray) -> 'HashIndex':
+        """Build an index over a whole column of codes at once"""
+        index = cls()
+        if len(codes):
+            index._grouped = np.argsort(codes, kind='stable').astype(np.int64)
+            index._offsets = np.concatenate(([0], np.cumsum(np.bincount(codes)))).astype(np.int64)
+        return index
+
+    def rows(self, code: int) -> np.ndarray:
+        """Copy of the row ids for `code` (a view would pin the shared arrays)"""
+        built = self._built(code)
+        postings = self._postings.get(code)
+        if postings is None:
+            return built.copy()
+        return np.concatenate((built, np.frombuffer(postings, dtype=np.int64)))
+
+
+class TimeIndex:
+    """
+    Row ids ordered by a timestamp column, for range queries by binary search.
+
+    The index follows the append-only store lazily. Rows appended since the
+    last lookup are sorted among themselves; those not older than the newest
+    indexed timestamp (the usual case) are appended to the main run in place,
+    and the rest go to a small sorted side run. The side run is merged into
+    the main one only once it passes a fraction of the rows, so steady ingest
+    costs amortized O(1) per row rather than a copy of the index per lookup.
+    """
+
+    # The side run is merged past max(SIDE_MIN_ROWS, rows / SIDE_FRACTION) rows
+    SIDE_MIN_ROWS = 4096
+    SIDE_FRACTION = 32
+
+    def __init__(self, store, field: str):
+        self.store = store
+        self.field = field
+        # Main run, with spare capacity past _size
+        self._keys = np.empty(0, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._side_keys = np.empty(0, dtype=np.int64)
+        self._side_rows = np.empty(0, dtype=np.int64)
+        self._synced = 0
+
+    def _sync(self):
+        size = len(self.store)
+        if self._synced == size:
+            return
+        new_keys = self.store.column(self.field)[self._synced:size].astype(np.int64)
+        order = np.argsort(new_keys, kind='stable')
+        new_keys = new_keys[order]
+        new_rows = order.astype(np.int64) + self._synced
+        self._synced = size
+
+        # Keys from the newest indexed one on extend the main run; equal keys
+        # land after it, keeping ties in insertion order
+        n = self._size
+        cut = int(np.searchsorted(new_keys, self._keys[n - 1], side='left')) if n else 0
+        self._keys = grow(self._keys, n + len(new_keys) - cut)
+        self._rows = grow(self._rows, n + len(new_keys) - cut)
+        self._keys[n:n + len(new_keys) - cut] = new_keys[cut:]
+        self._rows[n:n + len(new_keys) - cut] = new_rows[cut:]
+        self._size = n + len(new_keys) - cut
+
+        if cut:
+            positions = np.searchsorted(self._side_keys, new_keys[:cut], side='right')
+            self._side_keys = np.insert(self._side_keys, positions, new_keys[:cut])
+            self._side_rows = np.insert(self._side_rows, positions, new_rows[:cut])
+            if len(self._side_keys) > max(self.SIDE_MIN_ROWS, self._size // self.SIDE_FRACTION):
+                self._merge_side()
+
+    def _merge_side(self):
+        keys, rows = self._keys[:self._size], self._rows[:self._size]
+        # Side rows were appended later than any main row with an equal key
+        positions = np.searchsorted(keys, self._side_keys, side='right')
+        self._keys = np.insert(keys, positions, self._side_keys)
+        self._rows = np.insert(rows, positions, self._side_rows)
+        self._size = len(self._keys)
+        self._side_keys = np.empty(0, dtype=np.int64)
+        self._side_rows = np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _bounds(keys: np.ndarray, since: Optional[int], until: Optional[int]):
+        start = 0 if since is None else int(np.searchsorted(keys, since, side='left'))
+        stop = len(keys) if until is None else int(np.searchsorted(keys, until, side='right'))
+        return start, max(start, stop)
+
+    def count(self, since: Optional[int] = None, until: Optional[int] = None) -> int:
+        """Number of rows with since <= timestamp <= until (bounds in epoch microseconds)"""
+        self._sync()
+        start, stop = self._bounds(self._keys[:self._size], since, until)
+        side_start, side_stop = self._bounds(self._side_keys, since, until)
+        return stop - start + side_stop - side_start
+
+    def rows(self, since: Optional[int] = None, until: Optional[int] = None) -> np.ndarray:
+        """Row ids with since <= timestamp <= until, in timestamp order"""
+        self._sync()
+        keys = self._keys[:self._size]
+        start, stop = self._bounds(keys, since, until)
+        side_start, side_stop = self._bounds(self._side_keys, since, until)
+        if side_start == side_stop:
+            return self._rows[start:stop].copy()
+        matched_keys = np.concatenate([keys[start:stop], self._side_keys[side_start:side_stop]])
+        matched_rows = np.concatenate([self._rows[start:stop], self._side_rows[side_start:side_stop]])
+        return matched_rows[np.lexsort((matched_rows, matched_keys))]
+
+
+class WeblogStore:
+    """Append-only columnar store for instances of a Pydantic model"""
+
+    def __init__(self, model, capacity: int = _INITIAL_CAPACITY, indexed: Sequence[str] = ()):
+        self.model = model
+        self.fields: List[str] = list(model.model_fields)
+        self.kinds: Dict[str, str] = {
+            name: _column_kind(info.annotation) for name, info in model.model_fields.items()
+        }
+        self._size = 0
+        self._capacity = max(1, capacity)
+        self._data: Dict[str, np.ndarray] = {}
+        self._dictionaries: Dict[str, List[Any]] = {}
+        self._lookups: Dict[str, Dict[Any, int]] = {}
+        self._dictionary_arrays: Dict[str, np.ndarray] = {}
+
+        for name, kind in self.kinds.items():
+            self._data[name] = np.zeros(self._capacity, dtype=_DTYPES[kind])
+            if kind == 'string':
+                self._dictionaries[name] = []
+                self._lookups[name] = {}
+            elif kind == 'timestamp':
+                self._data[_TZ_COLUMN] = np.zeros(self._capacity, dtype=np.int32)
+                self._dictionaries[_TZ_COLUMN] = []
+                self._lookups[_TZ_COLUMN] = {}
+
+        # Hash indexes over dictionary-encoded columns, kept current on append
+        self.indexes: Dict[str, HashIndex] = {}
+        for name in indexed:
+            if self.kinds[name] != 'string':
+                raise ValueError(f"Only string columns can be indexed, not {name!r}")
+            self.indexes[name] = HashIndex()
+
+        # Timestamp ordering for range queries (on the first timestamp field)
+        self.time_field = next((name for name, kind in self.kinds.items() if kind == 'timestamp'), None)
+        self.time_index = TimeIndex(self, self.time_field) if self.time_field else None
+
+        # Callbacks notified with the range of new row ids after every write
+        self._listeners: List[Callable[[range], None]] = []
+        # Incremented on every write; lets caches tell whether data changed
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.entries())
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _reserve(self, size: int):
+        """Grow every column so that it can hold at least `size` rows"""
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2)
+        for name, data in self._data.items():
+            grown = np.zeros(capacity, dtype=data.dtype)
+            grown[:self._size] = data[:self._size]
+            self._data[name] = grown
+        self._capacity = capacity
+
+    def _encode(self, name: str, value) -> int:
+        lookup = self._lookups[name]
+        code = lookup.get(value)
+        if code is None:
+            code = len(self._dictionaries[name])
+            self._dictionaries[name].append(value)
+            lookup[value] = code
+        return code
+
+    def _write_row(self, row: int, entry):
+        for name, kind in self.kinds.items():
+            value = getattr(entry, name)
+            if kind == 'string':
+                code = self._encode(name, value)
+                self._data[name][row] = code
+                index = self.indexes.get(name)
+                if index is not None:
+                    index.add(code, row)
+            elif kind == 'timestamp':
+                offset = value.utcoffset()
+                self._data[name][row] = to_epoch_us(value)
+                self._data[_TZ_COLUMN][row] = self._encode(
+                    _TZ_COLUMN, None if offset is None else int(offset.total_seconds())
+                )
+            else:
+                self._data[name][row] = value
+
+    def subscribe(self, listener: Callable[[range], None]):
+        """Call `listener(rows)` with the range of new row ids after each append/extend"""
+        self._listeners.append(listener)
+
+    def _notify(self, rows: range):
+        if len(rows):
+            self.version += 1
+            for listener in self._listeners:
+                listener(rows)
+
+    def _append_row(self, entry) -> int:
+        row = self._size
+        self._reserve(row + 1)
+        self._write_row(row, entry)
+        self._size = row + 1
+        return row
+
+    def append(self, entry) -> int:
+        """Append one model instance and return its row id"""
+        row = self._append_row(entry)
+        self._notify(range(row, row + 1))
+        return row
+
+    def extend(self, entries: Iterable[Any]) -> range:
+        """Append many model instances and return the range of new row ids"""
+        start = self._size
+        for entry in entries:
+            self._append_row(entry)
+        rows = range(start, self._size)
+        self._notify(rows)
+        return rows
+
+    def extend_from(self, other: 'WeblogStore', first: int = 0) -> range:
+        """Append the rows of another store with the same schema from row `first` on, column by column"""
+        count = max(len(other) - first, 0)
+        start = self._size
+        self._reserve(start + count)
+        for name, data in self._data.items():
+            values = other.column(name)[first:first + count]
+            if name in self._dictionaries:
+                # Translate the other store's codes into this store's dictionary
+                mapping = np.array(
+                    [self._encode(name, value) for value in other.dictionary(name)], dtype=data.dtype
+                )
+                values = mapping[values] if len(mapping) else values
+            data[start:start + count] = values
+            index = self.indexes.get(name)
+            if index is not None:
+                index.extend(data[start:start + count], start)
+        self._size = start + count
+        rows = range(start, self._size)
+        self._notify(rows)
+        return rows
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column view; string columns return their integer codes"""
+        return self._data[name][:self._size]
+
+    def dictionary(self, name: str) -> List[Any]:
+        """Distinct values of a dictionary-encoded column, indexed by code"""
+        return self._dictionaries[name]
+
+    def code_of(self, name: str, value) -> Optional[int]:
+        """Code of `value` in a dictionary-encoded column, or None if never seen"""
+        return self._lookups[name].get(value)
+
+    def _dictionary_array(self, name: str) -> np.ndarray:
+        values = self._dictionaries[name]
+        cached = self._dictionary_arrays.get(name)
+        if cached is None or len(cached) != len(values):
+            cached = np.empty(len(values), dtype=object)
+            cached[:] = values
+            self._dictionary_arrays[name] = cached
+        return cached
+
+    def values(self, name: str, rows: Optional[Sequence[int]] = None) -> List[Any]:
+        """Decoded Python values of one column for the given rows (all rows by default)"""
+        data = self.column(name)
+        if rows is not None:
+            data = data[np.asarray(rows, dtype=np.int64)]
+        kind = self.kinds[name]
+        if kind == 'string':
+            return self._dictionary_array(name)[data].tolist()
+        if kind == 'timestamp':
+            offsets = self.column(_TZ_COLUMN)
+            if rows is not None:
+                offsets = offsets[np.asarray(rows, dtype=np.int64)]
+            tz_values = self._dictionaries[_TZ_COLUMN]
+            return [from_epoch_us(us, tz_values[code]) for us, code in zip(data.tolist(), offsets.tolist())]
+        return data.tolist()
+
+    def _mask(self, name: str, value, rows: np.ndarray) -> np.ndarray:
+        data = self.column(name)[rows]
+        kind = self.kinds[name]
+        if kind == 'string':
+            code = self.code_of(name, value)
+            if code is None:
+                return np.zeros(len(rows), dtype=bool)
+            return data == code
+        if kind == 'timestamp':
+            return data == to_epoch_us(value)
+        return data == value
+
+    def filter(self, since: Optional[int] = None, until: Optional[int] = None, **conditions) -> np.ndarray:
+        """Row ids (ascending) whose columns equal every given value
+
+        `since`/`until` (epoch microseconds, inclusive) bound the timestamp.
+        Candidates come from whichever is most selective: the hash index of
+        an indexed column or the time index range, so the cost follows the
+        number of matches; remaining conditions are checked on those
+        candidates only.
+        """
+        indexed = []
+        for name, value in conditions.items():
+            if name in self.indexes:
+                code = self.code_of(name, value)
+                if code is None:
+                    return np.empty(0, dtype=np.int64)
+                indexed.append((self.indexes[name].count(code), name, code))
+        indexed.sort()
+
+        time_bounded = since is not None or until is not None
+        time_count = self.time_index.count(since, until) if time_bounded else None
+
+        if time_bounded and (not indexed or time_count <= indexed[0][0]):
+            rows = np.sort(self.time_index.rows(since, until))
+            remaining = conditions
+            time_bounded = False
+        elif indexed:
+            _, first, code = indexed[0]
+            rows = self.indexes[first].rows(code)
+            remaining = {name: value for name, value in conditions.items() if name != first}
+        else:
+            rows = np.arange(self._size, dtype=np.int64)
+            remaining = conditions
+
+        if time_bounded:
+            timestamps = self.column(self.time_field)[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if since is not None:
+                keep &= timestamps >= since
+            if until is not None:
+                keep &= timestamps <= until
+            rows = rows[keep]
+
+        for name, value in remaining.items():
+            if not len(rows):
+                break
+            rows = rows[self._mask(name, value, rows)]
+        return rows
+
+    def columnar(self, rows: np.ndarray, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Rows as one array per field. String columns are dictionary-encoded with
+        a dictionary holding only the values present in `rows`; timestamps are
+        UTC epoch microseconds.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns: Dict[str, Any] = {}
+        for name in fields or self.fields:
+            kind = self.kinds[name]
+            data = self.column(name)[rows]
+            if kind == 'string':
+                used, codes = np.unique(data, return_inverse=True)
+                columns[name] = {
+                    'type': 'dictionary',
+                    'dictionary': self._dictionary_array(name)[used].tolist(),
+                    'codes': codes.reshape(-1).tolist(),
+                }
+            elif kind == 'timestamp':
+                columns[name] = {'type': 'timestamp', 'unit': 'us', 'values': data.tolist()}
+            else:
+                columns[name] = {'type': kind, 'values': data.tolist()}
+        return {'rows': len(rows), 'columns': columns}
+
+    def entry(self, row: int):
+        """Materialize a single row as a model instance"""
+        return self.entries([row])[0]
+
+    def entries(self, rows: Optional[Sequence[int]] = None) -> List[Any]:
+        """Materialize rows (all rows by default) as model instances"""
+        columns = [self.values(name, rows) for name in self.fields]
+        construct = self.model.model_construct
+        fields = self.fields
+        return [construct(**dict(zip(fields, values))) for values in zip(*columns)]
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def save(self, path: str, metadata: Optional[Dict[str, Any]] = None):
+        """Write the store to a snapshot directory, replacing any previous one"""
+        columns = ((name, data[:self._size]) for name, data in self._data.items())
+        write_snapshot(path, self.kinds, columns, self._dictionaries, metadata)
+
+    @classmethod
+    def load(cls, model, path: str, indexed: Sequence[str] = (), mmap: bool = False) -> 'WeblogStore':
+        """
+        Load a snapshot written by `save`. With `mmap=True` the columns are
+        memory-mapped copy-on-write instead of read into memory.
+        """
+        manifest = read_manifest(path)
+        if manifest is None:
+            raise ValueError(f"No usable snapshot at {path}")
+
+        store = cls(model, capacity=1, indexed=indexed)
+        if manifest['kinds'] != store.kinds:
+            raise ValueError(f"Snapshot at {path} was written for a different schema")
+
+        rows = manifest['rows']
+        for name, filename in manifest['columns'].items():
+            data = np.load(os.path.join(path, filename), mmap_mode='c' if mmap else None)
+            if name not in store._data or data.dtype != store._data[name].dtype or len(data) != rows:
+                raise ValueError(f"Snapshot column {name!r} does not match the schema")
+            store._data[name] = data
+        store._size = store._capacity = rows
+
+        dictionaries = dict(manifest['dictionaries'])
+        for name, filename in manifest.get('dictionary_files', {}).items():
+            with open(os.path.join(path, filename)) as f:
+                dictionaries[name] = json.load(f)
+        for name, values in dictionaries.items():
+            store._dictionaries[name] = values
+            store._lookups[name] = {value: code for code, value in enumerate(values)}
+        for name in store.indexes:
+            store.indexes[name] = HashIndex.build(store.column(name))
+        return store
+
+
+def _fsync_path(path: str):
+    """fsync a file or directory by path"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save_array(path: str, data: np.ndarray):
+    with open(path, 'wb') as f:
+        np.save(f, data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _save_json(path: str, value: Any):
+    with open(path, 'w') as f:
+        json.dump(value, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def recover_snapshot(path: str):
+    """
+    Finish or undo a snapshot swap interrupted by a crash: put the previous
+    snapshot back if the new one never got into place, and drop it otherwise.
+    """
+    aside = f"{path}{_ASIDE_SUFFIX}"
+    if not os.path.exists(aside):
+        return
+    if os.path.exists(path):
+        shutil.rmtree(aside)
+    else:
+        os.rename(aside, path)
+    _fsync_path(os.path.dirname(os.path.abspath(path)))
+
+
+def write_snapshot(
+    path: str,
+    kinds: Dict[str, str],
+    columns: Iterable[Tuple[str, np.ndarray]],
+    dictionaries: Dict[str, List[Any]],
+    metadata: Optional[Dict[str, Any]] = None,
+):
+    """
+    Write a snapshot directory from raw columns, replacing any previous one.
+
+    `kinds` maps every field to its column kind and `columns` yields
+    (name, array) pairs, one at a time so callers can build them lazily:
+    dictionary codes for strings, UTC epoch microseconds for timestamps.
+    Timestamp columns without a UTC offset column are recorded as UTC.
+
+    Every file is fsynced before the new directory replaces the old one, and
+    the old one is only renamed aside until then, so a crash leaves either
+    snapshot complete (see recover_snapshot).
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    files: Dict[str, str] = {}
+    rows: Optional[int] = None
+    for name, data in columns:
+        kind = 'string' if name == _TZ_COLUMN else kinds[name]
+        data = np.asarray(data, dtype=_DTYPES[kind])
+        if rows is not None and len(data) != rows:
+            raise ValueError(f"Column {name!r} has {len(data)} rows instead of {rows}")
+        rows = len(data)
+        files[name] = f"{name}.npy"
+        _save_array(os.path.join(tmp_path, files[name]), data)
+    rows = rows or 0
+
+    dictionaries = dict(dictionaries)
+    if any(kind == 'timestamp' for kind in kinds.values()) and _TZ_COLUMN not in files:
+        files[_TZ_COLUMN] = f"{_TZ_COLUMN}.npy"
+        _save_array(os.path.join(tmp_path, files[_TZ_COLUMN]), np.zeros(rows, dtype=np.int32))
+        dictionaries[_TZ_COLUMN] = [0]
+
+    inline, dictionary_files = {}, {}
+    for name, values in dictionaries.items():
+        if len(values) <= INLINE_DICTIONARY_LIMIT:
+            inline[name] = values
+            continue
+        dictionary_files[name] = f"{name}.dictionary.json"
+        _save_json(os.path.join(tmp_path, dictionary_files[name]), values)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'rows': rows,
+        'kinds': kinds,
+        'columns': files,
+        'dictionaries': inline,
+        'dictionary_files': dictionary_files,
+        'metadata': metadata or {},
+    }
+    _save_json(os.path.join(tmp_path, MANIFEST_FILE), manifest)
+    _fsync_path(tmp_path)
+
+    recover_snapshot(path)
+    aside = f"{path}{_ASIDE_SUFFIX}"
+    if os.path.exists(path):
+        os.rename(path, aside)
+    os.rename(tmp_path, path)
+    _fsync_path(os.path.dirname(os.path.abspath(path)))
+    shutil.rmtree(aside, ignore_errors=True)
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """The manifest of a snapshot directory, or None if missing, unreadable or outdated"""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return None
+    return manifest
+
+
+def file_fingerprint(path: str, with_hash: bool = True) -> Dict[str, Any]:
+    """Size, mtime and (optionally) SHA-256 of a file, used to tell if a snapshot is stale"""
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+
+def snapshot_matches(manifest: Optional[Dict[str, Any]], source_path: str) -> bool:
+    """
+    True if a snapshot was built from the current contents of `source_path`.
+    An unchanged size and mtime is trusted as is; if only the mtime moved
+    (e.g. the file was touched or copied) the content hash decides.
+    """
+    if manifest is None:
+        return False
+    recorded = manifest.get('metadata', {}).get('source')
+    if not recorded:
+        return False
+    current = file_fingerprint(source_path, with_hash=False)
+    if current['size'] != recorded.get('size'):
+        return False
+    if current['mtime_ns'] == recorded.get('mtime_ns'):
+        return True
+    return file_fingerprint(source_path)['sha256'] == recorded.get('sha256')
@@ -71,6 +71,9 @@ const Dashboard: React.FC = () => {
 
     // State for Visitor Insights filters and data
     const [searchTerm, setSearchTerm] = useState<string>('');
+    // Visitor IDs matching `term`, from the server-side search index (null
+    // when that search failed); only applied while `term` is still searchTerm
+    const [searchMatches, setSearchMatches] = useState<{ term: string; ids: Set<string> | null } | null>(null);
     const [deviceFilter, setDeviceFilter] = useState<string>('All');
     const [conversionFilter, setConversionFilter] = useState<string>('All');
     const [minEngagement, setMinEngagement] = useState<string>('');
@@ -107,6 +110,38 @@ const Dashboard: React.FC = () => {
         fetchWeblogs();
     }, []);
 
+    useEffect(() => {
+        if (!searchTerm) {
+            setSearchMatches(null);
+            return;
+        }
+        let cancelled = false;
+        // Debounce so typing only searches once the input settles
+        const timer = setTimeout(async () => {
+            try {
+                const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+                const matches: string[] = [];
+                let total = Infinity;
+                while (matches.length < total) {
+                    const response = await axios.get(`${baseUrl}/search`, {
+                        params: { q: searchTerm, limit: 10000, offset: matches.length },
+                    });
+                    total = response.data.total;
+                    if (response.data.visitor_ids.length === 0) break;
+                    matches.push(...response.data.visitor_ids);
+                }
+                if (!cancelled) setSearchMatches({ term: searchTerm, ids: new Set(matches) });
+            } catch (err) {
+                console.error(err);
+                if (!cancelled) setSearchMatches({ term: searchTerm, ids: null });
+            }
+        }, 150);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [searchTerm]);
+
     useEffect(() => {
         if (weblogs.length > 0) {
             weblogs.forEach(log => {
@@ -154,19 +189,11 @@ const Dashboard: React.FC = () => {
                 };
             });
 
-            // Apply search term filter for Visitors
-            const lowerCaseSearchTerm = searchTerm.toLowerCase();
-            if (lowerCaseSearchTerm) {
-                visitors = visitors.filter(visitor =>
-                    visitor.visitor_id.toLowerCase().includes(lowerCaseSearchTerm) ||
-                    visitor.country.toLowerCase().includes(lowerCaseSearchTerm) ||
-                    visitor.city.toLowerCase().includes(lowerCaseSearchTerm) ||
-                    visitor.weblogs.some(log => 
-                        log.page_visited.toLowerCase().includes(lowerCaseSearchTerm) ||
-                        log.page_title.toLowerCase().includes(lowerCaseSearchTerm) ||
-                        log.utm_source.toLowerCase().includes(lowerCaseSearchTerm)
-                    )
-                );
+            // Apply search term filter for Visitors; until the matches for the
+            // current term arrive nothing is shown rather than stale results
+            if (searchTerm) {
+                const ids = searchMatches?.term === searchTerm ? searchMatches.ids : null;
+                visitors = ids ? visitors.filter(visitor => ids.has(visitor.visitor_id)) : [];
             }
     
             // Apply device type filter for Visitors
@@ -235,7 +262,7 @@ const Dashboard: React.FC = () => {
 
             setConsolidatedVisitors(visitors);
         }
-    }, [weblogs, searchTerm, deviceFilter, conversionFilter, minEngagement, maxEngagement, sortBy, startDateFilter, endDateFilter, minAvgTimeSpent, maxAvgTimeSpent]);
+    }, [weblogs, searchTerm, searchMatches, deviceFilter, conversionFilter, minEngagement, maxEngagement, sortBy, startDateFilter, endDateFilter, minAvgTimeSpent, maxAvgTimeSpent]);
 
     // Extract unique device types for filter dropdown
     const uniqueDeviceTypes = Array.from(new Set(weblogs.map(log => log.device_type)));
@@ -315,6 +342,9 @@ const Dashboard: React.FC = () => {
         });
     };
 
+    const searchPending = searchTerm !== '' && searchMatches?.term !== searchTerm;
+    const searchFailed = searchTerm !== '' && searchMatches?.term === searchTerm && searchMatches.ids === null;
+
     if (loading) {
         return <div className="dashboard-container">Loading dashboard...</div>;
     }
@@ -426,7 +456,11 @@ const Dashboard: React.FC = () => {
                     </select>
                 </div>
                 <div className="visitor-insights-grid">
-                    {groupBy === 'none' ? renderVisitorCards(consolidatedVisitors) : renderGroupedCards()}
+                    {searchPending ? (
+                        <p>Searching...</p>
+                    ) : searchFailed ? (
+                        <p className="error-message">Search failed.</p>
+                    ) : groupBy === 'none' ? renderVisitorCards(consolidatedVisitors) : renderGroupedCards()}
                 </div>
             </section>
             
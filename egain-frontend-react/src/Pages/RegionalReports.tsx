@@ -1,38 +1,42 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import { MapContainer, TileLayer, useMap } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import 'leaflet.heat'; // Import Leaflet.heat
 
-interface WeblogEntry {
-    timestamp: string;
-    visitor_id: string;
-    session_id: string;
-    page_visited: string;
-    page_title: string;
-    ip_address: string;
-    user_agent: string;
-    referrer: string;
-    language: string;
-    screen_resolution: string;
-    viewport_size: string;
-    device_type: string;
-    operating_system: string;
-    browser: string;
-    country: string;
-    region: string;
+interface GeoLocation {
     city: string;
-    isp: string;
-    utm_source: string;
-    utm_medium: string;
-    utm_campaign: string;
-    page_load_time_ms: number;
-    time_on_page_seconds: number;
-    scroll_depth_percent: number;
-    clicks_count: number;
-    is_bounce: boolean;
-    is_converted: boolean;
-    conversion_type: string;
-    engagement_score: number;
+    country: string;
+    latitude: number | null;
+    longitude: number | null;
+    page_views: number;
+    sessions: number;
+    avg_engagement: number;
+    avg_session_time: number;
+    page_traffic: { [page: string]: number };
+}
+
+interface GeoStats {
+    locations: GeoLocation[];
+    max: {
+        avg_engagement: number;
+        avg_session_time: number;
+        page_traffic: { [page: string]: number };
+    };
+}
+
+interface TopValue {
+    value: string;
+    count: number;
+}
+
+interface CountryGroup {
+    country: string;
+    count: number;
+    distinct_visitors: number;
+    mean: { [field: string]: number };
+    conversion_rate: number;
+    bounce_rate: number;
+    top: { [field: string]: TopValue[] };
 }
 
 interface RegionalSummary {
@@ -48,23 +52,6 @@ interface RegionalSummary {
     topReferrer: string;
 }
 
-const getCoordinates = (city: string, country: string): [number, number, number] => {
-    const coordinates: { [key: string]: [number, number, number] } = {
-        'San Francisco, United States': [37.7749, -122.4194, 1],
-        'London, United Kingdom': [51.5074, 0.1278, 1],
-        'New York, United States': [40.7128, -74.0060, 1],
-        'Munich, Germany': [48.1351, 11.5820, 1],
-        'Toronto, Canada': [43.6532, -79.3832, 1],
-        'Paris, France': [48.8566, 2.3522, 1],
-        'Madrid, Spain': [40.4168, -3.7038, 1],
-        'Austin, United States': [30.2672, -97.7431, 1],
-        'Vancouver, Canada': [49.2827, -123.1207, 1],
-        'Sydney, Australia': [33.8688, 151.2093, 1],
-        'Seattle, United States': [47.6062, -122.3321, 1]
-    };
-    return coordinates[`${city}, ${country}`] || [0, 0, 0];
-};
-
 interface CustomHeatmapLayerProps {
     points: [number, number, number][];
 }
@@ -99,134 +86,86 @@ const CustomHeatmapLayer: React.FC<CustomHeatmapLayerProps> = ({ points }) => {
 };
 
 const RegionalReports: React.FC = () => {
-    const [points, setPoints] = useState<[number, number, number][]>([]);
     const [selectedMetric, setSelectedMetric] = useState<'engagement' | 'time' | 'traffic'>('engagement');
     const [selectedPage, setSelectedPage] = useState<string>('');
     const [availablePages, setAvailablePages] = useState<string[]>([]);
+    const [geoStats, setGeoStats] = useState<GeoStats | null>(null);
     const [summaries, setSummaries] = useState<RegionalSummary[]>([]);
 
+    // Everything the page shows comes from two small pre-aggregated responses,
+    // fetched once; switching metric or page only recomputes the points
     useEffect(() => {
-        const fetchWeblogs = async () => {
+        const fetchStats = async () => {
             try {
                 const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-                const response = await fetch(`${baseUrl}/weblogs/`);
-                const data = await response.json();
-                const weblogs: WeblogEntry[] = data.weblogs;
+                const [geoResponse, groupResponse, referrerResponse] = await Promise.all([
+                    fetch(`${baseUrl}/stats/geo`),
+                    fetch(`${baseUrl}/stats/group-by?by=country&top=device_type,operating_system&k=1`),
+                    // Every (country, referrer) pair, so the top real referrer is
+                    // found however many direct or empty ones outrank it
+                    fetch(`${baseUrl}/stats/group-by?by=country,referrer&top=`),
+                ]);
+                const geo: GeoStats = await geoResponse.json();
+                const groups: CountryGroup[] = (await groupResponse.json()).groups;
+                const referrerGroups: { country: string; referrer: string }[] = (await referrerResponse.json()).groups;
+                setGeoStats(geo);
 
-                const uniquePages = Array.from(new Set(weblogs.map(log => log.page_visited))).sort();
-                setAvailablePages(uniquePages);
-
-                // Calculate regional summaries
-                const regionalData: { [country: string]: WeblogEntry[] } = {};
-                weblogs.forEach(log => {
-                    if (!regionalData[log.country]) {
-                        regionalData[log.country] = [];
+                // Groups come by descending count, so the first one per country wins
+                const topReferrers: { [country: string]: string } = {};
+                referrerGroups.forEach(({ country, referrer }) => {
+                    if (referrer && referrer !== 'direct' && !(country in topReferrers)) {
+                        topReferrers[country] = referrer;
                     }
-                    regionalData[log.country].push(log);
-                });
-
-                const calculatedSummaries: RegionalSummary[] = Object.keys(regionalData).map(country => {
-                    const logs = regionalData[country];
-                    const totalVisitors = new Set(logs.map(log => log.visitor_id)).size;
-                    const totalPageViews = logs.length;
-                    const totalEngagement = logs.reduce((acc, log) => acc + log.engagement_score, 0);
-                    const avgEngagement = (totalEngagement / totalPageViews).toFixed(2);
-                    const totalTimeOnPage = logs.reduce((acc, log) => acc + log.time_on_page_seconds, 0);
-                    const avgTimeOnPage = (totalTimeOnPage / totalPageViews).toFixed(2);
-                    const totalConversions = logs.filter(log => log.is_converted).length;
-                    const conversionRate = ((totalConversions / totalPageViews) * 100).toFixed(2);
-                    const deviceTypes = logs.map(log => log.device_type);
-                    const mostCommonDevice = deviceTypes.sort((a,b) => deviceTypes.filter(v => v===a).length - deviceTypes.filter(v => v===b).length).pop() || 'N/A';
-                    const osTypes = logs.map(log => log.operating_system);
-                    const mostCommonOS = osTypes.sort((a,b) => osTypes.filter(v => v===a).length - osTypes.filter(v => v===b).length).pop() || 'N/A';
-                    const bounces = logs.filter(log => log.is_bounce).length;
-                    const bounceRate = ((bounces / totalPageViews) * 100).toFixed(2);
-                    const referrers = logs.map(log => log.referrer).filter(r => r && r !== 'direct');
-                    const topReferrer = referrers.sort((a,b) => referrers.filter(v => v===a).length - referrers.filter(v => v===b).length).pop() || 'Direct';
-
-                    return {
-                        country,
-                        totalVisitors,
-                        totalPageViews,
-                        avgEngagement,
-                        avgTimeOnPage,
-                        conversionRate: `${conversionRate}%`,
-                        mostCommonDevice,
-                        mostCommonOS,
-                        bounceRate: `${bounceRate}%`,
-                        topReferrer,
-                    };
                 });
-                setSummaries(calculatedSummaries);
 
-
-                if (selectedMetric === 'traffic' && !selectedPage && uniquePages.length > 0) {
-                    setSelectedPage(uniquePages[0]);
-                    return; // Re-run effect after setting default page
+                const pages = Object.keys(geo.max.page_traffic).sort();
+                setAvailablePages(pages);
+                if (pages.length > 0) {
+                    setSelectedPage(page => page || pages[0]);
                 }
 
-                const aggregatedData: { [key: string]: { lat: number, lon: number, total: number, count: number, sessions: { [key: string]: number[] }, pageTraffic: { [key: string]: number } } } = {};
-
-                weblogs.forEach(log => {
-                    const locationKey = `${log.city}, ${log.country}`;
-                    if (!aggregatedData[locationKey]) {
-                        const [lat, lon, _] = getCoordinates(log.city, log.country);
-                        if (lat === 0 && lon === 0) return; // Skip unknown locations
-                        aggregatedData[locationKey] = { lat, lon, total: 0, count: 0, sessions: {}, pageTraffic: {} };
-                    }
-
-                    if (selectedMetric === 'engagement') {
-                        aggregatedData[locationKey].total += log.engagement_score;
-                        aggregatedData[locationKey].count += 1;
-                    } else if (selectedMetric === 'time') {
-                        if (!aggregatedData[locationKey].sessions[log.session_id]) {
-                            aggregatedData[locationKey].sessions[log.session_id] = [];
-                        }
-                        aggregatedData[locationKey].sessions[log.session_id].push(log.time_on_page_seconds);
-                    } else if (selectedMetric === 'traffic') {
-                        if (selectedPage && log.page_visited === selectedPage) {
-                            aggregatedData[locationKey].pageTraffic[log.page_visited] = (aggregatedData[locationKey].pageTraffic[log.page_visited] || 0) + 1;
-                        }
-                    }
-                });
-
-                const heatmapPoints: [number, number, number][] = [];
-                Object.keys(aggregatedData).forEach(locationKey => {
-                    const data = aggregatedData[locationKey];
-                    let intensity = 0;
+                setSummaries(groups.map(group => ({
+                    country: group.country,
+                    totalVisitors: group.distinct_visitors,
+                    totalPageViews: group.count,
+                    avgEngagement: group.mean.engagement_score.toFixed(2),
+                    avgTimeOnPage: group.mean.time_on_page_seconds.toFixed(2),
+                    conversionRate: `${(group.conversion_rate * 100).toFixed(2)}%`,
+                    mostCommonDevice: group.top.device_type[0]?.value || 'N/A',
+                    mostCommonOS: group.top.operating_system[0]?.value || 'N/A',
+                    bounceRate: `${(group.bounce_rate * 100).toFixed(2)}%`,
+                    topReferrer: topReferrers[group.country] || 'Direct',
+                })));
+            } catch (error) {
+                console.error("Error fetching regional stats:", error);
+            }
+        };
 
-                    if (selectedMetric === 'engagement') {
-                        intensity = data.count > 0 ? data.total / data.count : 0;
-                        intensity = intensity / 10; // Normalize to 0-1 for heatmap gradient
-                    } else if (selectedMetric === 'time') {
-                        let totalSessionTime = 0;
-                        let sessionCount = 0;
-                        Object.values(data.sessions).forEach(times => {
-                            if (times.length > 0) {
-                                totalSessionTime += times.reduce((a, b) => a + b, 0) / times.length; // Avg time per session
-                                sessionCount += 1;
-                            }
-                        });
-                        intensity = sessionCount > 0 ? totalSessionTime / sessionCount : 0;
-                        intensity = intensity / 350; // Normalize based on max time_on_page_seconds from analysis
-                    } else if (selectedMetric === 'traffic') {
-                        intensity = data.pageTraffic[selectedPage] || 0;
-                        intensity = intensity / 10; // Assuming max 10 visits per page in a location for normalization
-                    }
+        fetchStats();
+    }, []);
 
-                    if (intensity > 0) {
-                        heatmapPoints.push([data.lat, data.lon, intensity]);
-                    }
-                });
+    const points = useMemo<[number, number, number][]>(() => {
+        if (!geoStats) return [];
+        const heatmapPoints: [number, number, number][] = [];
+        geoStats.locations.forEach(location => {
+            if (location.latitude === null || location.longitude === null) return; // Skip unknown locations
 
-                setPoints(heatmapPoints);
-            } catch (error) {
-                console.error("Error fetching weblogs:", error);
+            // Normalize to 0-1 for the heatmap gradient against the busiest location
+            let intensity = 0;
+            if (selectedMetric === 'engagement') {
+                intensity = location.avg_engagement / (geoStats.max.avg_engagement || 1);
+            } else if (selectedMetric === 'time') {
+                intensity = location.avg_session_time / (geoStats.max.avg_session_time || 1);
+            } else if (selectedMetric === 'traffic') {
+                intensity = (location.page_traffic[selectedPage] || 0) / (geoStats.max.page_traffic[selectedPage] || 1);
             }
-        };
 
-        fetchWeblogs();
-    }, [selectedMetric, selectedPage]); // Re-run effect when metric or page changes
+            if (intensity > 0) {
+                heatmapPoints.push([location.latitude, location.longitude, intensity]);
+            }
+        });
+        return heatmapPoints;
+    }, [geoStats, selectedMetric, selectedPage]);
 
     const defaultCenter: [number, number] = [20, 0]; 
     const defaultZoom = 2; 
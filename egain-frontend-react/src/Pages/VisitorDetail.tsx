@@ -60,10 +60,9 @@ const VisitorDetail: React.FC = () => {
         const fetchVisitorWeblogs = async () => {
             try {
                 const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-                const response = await axios.get(`${baseUrl}/weblogs/`);
-                const allWeblogs: WeblogEntry[] = response.data.weblogs;
-                const filteredLogs = allWeblogs.filter(log => log.visitor_id === visitorId);
-                setAllVisitorWeblogs(filteredLogs.sort((a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime()));
+                const response = await axios.get(`${baseUrl}/weblogs/`, { params: { visitor_id: visitorId } });
+                const visitorLogs: WeblogEntry[] = response.data.weblogs;
+                setAllVisitorWeblogs(visitorLogs.sort((a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime()));
             } catch (err) {
                 setError('Failed to fetch visitor weblogs.');
                 console.error(err);